@@ -1,20 +1,45 @@
 import os
+import math
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
+import numpy as np
 from difflib import SequenceMatcher
 import openpyxl
 from openpyxl.styles import Font
-from categories import categories  # Import categories from the separate file
-import tkinter as tk
-from tkinter import ttk, messagebox
-import re
+from openpyxl.cell import WriteOnlyCell
+from columnar_store import (
+    open_store_writer, write_store_chunk, parse_dates, apply_schema, to_output_frame,
+    amount_scale, schema_version, column_kontonummer,
+)
+from category_cache import load_cache, refresh_cache, save_cache, get_entry, put_entry
+from file_manifest import (
+    load_manifest, save_manifest, get_unchanged_entry, record_file, remove_missing_files,
+    append_frame, read_frames,
+)
+from ledger import (
+    open_ledger, new_batch, upsert_transactions, finish_statement, remove_statements, query_period_totals,
+    query_account_totals, load_category_totals, read_transaction_frames,
+)
+from category_rules import match_keywords, make_rules, current_rules, condition_mask
+from rule_stats import new_rule_stats, add_rule_hits, merge_rule_stats, build_rule_report, save_rule_report, format_rule_report
+from category_suggestions import apply_learned_categories
+from merchant_names import merchant_key_strings, normalize_merchants
+from duplicates import row_fingerprints, find_duplicates, statements_key
+from result_cache import publish_results
+from budgets import current_month, parse_month, parse_amount, save_budgets, query_budget_variance
+from stage_profiler import (
+    start_run_report, measure_stage, merge_file_measurements, mark_file_cached, finish_run_report,
+    save_run_report, format_run_report,
+)
+import argparse
 
 # Define paths
 base_folder = os.path.dirname(os.path.abspath(__file__))
 input_folder = os.path.join(base_folder, "InputFolder")
 output_folder = os.path.join(base_folder, "OutputFolder")
-
-# Ensure folders exist
-os.makedirs(output_folder, exist_ok=True)
+cache_folder = os.path.join(base_folder, "CacheFolder")
 
 # Column names
 column_dato = "Dato"
@@ -26,117 +51,340 @@ column_inn_pa_konto = "Inn på konto"
 # Combine output flag
 combine_output = 1  # Set to 0 for separate files per input
 
-# Function to find similar names
-def find_similar_names(df, column_name, similarity_threshold=0.8):
-    unique_names = df[column_name].unique()
-    similar_groups = {}
-
-    for i, name1 in enumerate(unique_names):
-        for name2 in unique_names[i + 1:]:
-            similarity = SequenceMatcher(None, name1, name2).ratio()
-            if similarity >= similarity_threshold:
-                if name1 not in similar_groups:
-                    similar_groups[name1] = set()
-                similar_groups[name1].add(name2)
-
-    for base_name, similar_names in similar_groups.items():
-        for similar_name in similar_names:
-            df[column_name] = df[column_name].replace(similar_name, base_name)
+# Number of processes used to parse statements
+parse_workers = None  # None uses all CPUs, 1 parses the files one by one in this process
 
-# Function to categorize entries
-def categorize_entries(df, column_name, categories):
+# How the parse processes are started. Spawned workers start a fresh interpreter, forking
+# the GUI process would copy its Tk state and worker threads into every child.
+parse_start_method = "spawn"
+
+# Number of rows read at a time from each statement
+statement_chunk_size = None  # None reads each statement in one piece, e.g. 50000 keeps memory flat for large exports
+
+# Capture cProfile and tracemalloc data in the run report
+profile_run = 0  # Set to 1 for a deeper look at a slow run, it makes the run slower
+
+# Function to group similar names
+def group_similar_names(names, similarity_threshold=0.8):
     """
-    Categorize entries in the DataFrame based on keywords in the specified column.
-    Appends an underscore and iteration number to each category entry.
+    Group names whose SequenceMatcher ratio reaches the threshold.
+
+    Candidate pairs come from a prefix-filtering index over each name's
+    characters, so only pairs that can still reach the threshold are scored.
+    Matches are merged transitively with union-find and every name is mapped
+    to the first name of its group. Returns (mapping, stats).
     """
-    category_column = "Category"
-    df[category_column] = "Uncategorized"
+    names = [name for name in names if isinstance(name, str)]
+    parent = list(range(len(names)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # Turn each name into a set of (char, occurrence) tokens so that the
+    # character multiset overlap used by quick_ratio becomes a set overlap
+    token_sets = []
+    token_counts = {}
+    for name in names:
+        seen = {}
+        tokens = []
+        for char in name:
+            seen[char] = seen.get(char, 0) + 1
+            token = (char, seen[char])
+            tokens.append(token)
+            token_counts[token] = token_counts.get(token, 0) + 1
+        token_sets.append(tokens)
+    token_lookup = [set(tokens) for tokens in token_sets]
+
+    # ratio <= quick_ratio, so any pair reaching the threshold shares a token
+    # within the rarest-first prefix of both names
+    overlap_factor = similarity_threshold / (2 - similarity_threshold)
+    order = sorted(range(len(names)), key=lambda i: (len(names[i]), i))
+    index = {}
+    compared = 0
+
+    for i in order:
+        name1 = names[i]
+        tokens = sorted(token_sets[i], key=lambda token: (token_counts[token], token))
+        min_overlap = max(math.ceil(overlap_factor * len(tokens) - 1e-9), 1)
+        prefix = tokens[:len(tokens) - min_overlap + 1]
+        min_length = overlap_factor * len(name1) - 1e-9
+
+        candidates = set()
+        for token in prefix:
+            for j in index.get(token, ()):
+                if len(names[j]) >= min_length:
+                    candidates.add(j)
+
+        for j in candidates:
+            if find(i) == find(j):
+                continue
+            name2 = names[j]
+            compared += 1
+
+            # The token overlap is the numerator of quick_ratio, an upper bound of ratio
+            overlap = len(token_lookup[i] & token_lookup[j])
+            if 2 * overlap < similarity_threshold * (len(name1) + len(name2)) - 1e-9:
+                continue
+            matcher = SequenceMatcher(None, name1, name2) if i < j else SequenceMatcher(None, name2, name1)
+            if matcher.ratio() >= similarity_threshold:
+                root1, root2 = find(i), find(j)
+                parent[max(root1, root2)] = min(root1, root2)
+
+        for token in prefix:
+            index.setdefault(token, []).append(i)
+
+    mapping = {name: names[find(i)] for i, name in enumerate(names)}
+    total_pairs = len(names) * (len(names) - 1) // 2
+    stats = {
+        "names": len(names),
+        "groups": sum(1 for i in range(len(names)) if find(i) == i),
+        "compared": compared,
+        "pruned": total_pairs - compared,
+    }
+    return mapping, stats
+
+# Function to map similar names to the first name of their group
+def similar_name_mapping(names, similarity_threshold=0.8, cache=None):
+    """
+    Return the canonical name of every name, grouping similar names once. Returns (mapping, stats).
 
-    # Create a dictionary to track counts for each category
-    category_counts = {category: 0 for category in categories.keys()}
+    The names are compared by their merchant key, so the variants of a merchant
+    that differ only in card suffix, date or reference are grouped once per key.
+    If a description cache is given, names already seen map straight to their
+    cached canonical name. New names are grouped together with the canonical
+    names present, so a new variant of a known merchant keeps its old name.
+    """
+    unique_names = [name for name in dict.fromkeys(names) if isinstance(name, str)]
+    known = {}
+    new_names = []
+    for name in unique_names:
+        canonical = get_entry(cache, name, "canonical") if cache is not None else None
+        if canonical is None:
+            new_names.append(name)
+        else:
+            known[name] = canonical
+
+    # The first name with a key represents it, known canonical names come first
+    names = list(dict.fromkeys(known.values())) + new_names
+    keys = list(merchant_key_strings(pd.Series(names, dtype=object)))
+    representatives = {}
+    for name, key in zip(names, keys):
+        representatives.setdefault(key, name)
+
+    key_mapping, stats = group_similar_names(list(representatives), similarity_threshold)
+    mapping = {}
+    for name, key in zip(names[len(names) - len(new_names):], keys[len(names) - len(new_names):]):
+        mapping[name] = representatives[key_mapping[key]]
+        if cache is not None:
+            put_entry(cache, name, "canonical", mapping[name])
+    mapping.update(known)
+
+    print(f"Similar names: {len(unique_names)} unique, {stats['names']} merchant keys, {stats['groups']} groups, "
+          f"{stats['compared']} comparisons, {stats['pruned']} pruned")
+    return mapping, stats
 
-    for category, keywords in categories.items():
-        # Create a regex pattern to match whole words for each keyword
-        pattern = r'\b(?:' + '|'.join(re.escape(keyword) for keyword in keywords) + r')\b'
+# Function to find similar names
+def find_similar_names(df, column_name, similarity_threshold=0.8, cache=None, mapping=None):
+    """
+    Replace similar names in the specified column with the first name of their group.
 
-        # Create a mask for rows that match the category
-        mask = df[column_name].str.contains(pattern, case=False, na=False)
+    Pass the mapping from similar_name_mapping for all chunks of a statement, so
+    the names are grouped once and the result does not depend on the chunk size.
+    Without it the names in df are grouped here. Returns the canonical name of every name.
+    """
+    if mapping is None:
+        mapping = similar_name_mapping(df[column_name].unique(), similarity_threshold, cache)[0]
+    df[column_name] = df[column_name].map(mapping).fillna(df[column_name]).astype("category")
+    return mapping
 
-        # Update the category column with unique category names
-        for index in df[mask].index:
-            # Increment the count for the category and assign a unique name
-            category_counts[category] += 1
-            df.at[index, category_column] = f"{category}_{category_counts[category]}"
+# Function to categorize entries
+def categorize_entries(df, column_name, categories, cache=None, merchants=None, rules=None, stats=None):
+    """
+    Categorize entries in the DataFrame based on keywords in the specified column.
+
+    The Category column is a categorical of the category names and
+    "Uncategorized". The keywords are matched against the merchant keys of the
+    descriptions, given as merchants or derived here, once per unique key, and
+    the results are broadcast back to the rows through the key codes. A key that
+    matches several categories gets the one with the highest priority, between
+    equal priorities the one defined last, and the empty keyword in a category
+    makes it match every non-empty description. A category with amount or date
+    conditions only applies to the rows that meet them. If a description cache
+    is given, only keys missing from it are matched.
+
+    rules are the compiled rules from category_rules. Without them the
+    categories are compiled here, with the default options. With stats given,
+    the hits of every keyword and category are added to those rule statistics.
+    """
+    category_column = "Category"
+    if rules is None:
+        rules = make_rules(categories)
+    categories = rules["categories"]
+    rank = rules["rank"]
+    category_index = {category: position for position, category in enumerate(categories)}
+    if merchants is None:
+        merchants = normalize_merchants(df[column_name])
+
+    # Categories matched by every key, the last row is for missing keys and matches nothing
+    key_matches = np.zeros((len(merchants.cat.categories) + 1, len(categories)), dtype=bool)
+    key_keywords = []
+    for key_code, key in enumerate(merchants.cat.categories):
+        keywords = get_entry(cache, key, "keywords") if cache is not None else None
+        if keywords is None:
+            keywords = match_keywords(rules["matcher"], key)
+            if cache is not None:
+                put_entry(cache, key, "keywords", keywords)
+        key_keywords.append(keywords)
+        key_matches[key_code, [category_index[category] for category, keyword in keywords if category in category_index]] = True
+
+    codes = merchants.cat.codes.to_numpy()
+    if rules["conditional"]:
+        # The conditions depend on the row, so the matches are broadcast to the rows first
+        matches = key_matches[codes]
+        amounts = np.zeros(len(df), dtype=np.int64)
+        for column in (column_ut_fra_konto, column_inn_pa_konto):
+            if column in df.columns:
+                amounts += df[column].fillna(0).to_numpy(dtype=np.int64)
+        dates = df[column_dato] if column_dato in df.columns else pd.Series(pd.NaT, index=df.index)
+        names = list(categories)
+        for position in rules["conditional"]:
+            matches[:, position] &= condition_mask(rules["options"][names[position]], amounts, dates)
+    else:
+        matches = key_matches
+
+    # The matched category of the highest rank wins, rows or keys without a match are "Uncategorized"
+    scores = np.where(matches, rank + 1, 0)
+    winners = np.where(scores.max(axis=1, initial=0) > 0, scores.argmax(axis=1) if len(categories) else 0,
+                       len(categories))
+    if not rules["conditional"]:
+        winners = winners[codes]
+    df[category_column] = pd.Categorical.from_codes(winners, categories=list(categories) + ["Uncategorized"])
+
+    if stats is not None:
+        key_rows = np.bincount(codes[codes >= 0], minlength=len(key_keywords))
+        if rules["conditional"]:
+            # Rows with the same matches count once, weighted by their number
+            matches, weights = np.unique(matches, axis=0, return_counts=True)
+        else:
+            weights = np.append(key_rows, 0)
+        add_rule_hits(stats, list(categories), key_keywords, key_rows, matches, weights, winners)
 
     return df
 
-def clean_category_names(df, category_column="Category"):
+# Function to aggregate amounts per month and category
+def aggregate_periods(df):
     """
-    Remove the underscore and iteration number from the category names in the specified column.
+    Sum the amounts and count the entries per month and category in one grouped pass.
+
+    Rows without a valid date are kept under an empty month so they still
+    count towards the all-time totals. The sums are in øre.
     """
-    df[category_column] = df[category_column].str.replace(r'_\d+$', '', regex=True)
-    return df
+    for column in (column_ut_fra_konto, column_inn_pa_konto):
+        if "Category" not in df.columns or column not in df.columns:
+            raise ValueError(f"The required columns ('Category' and '{column}') are missing.")
+
+    month = parse_dates(df[column_dato]).dt.to_period("M").rename("Month")
+    period_totals = df.groupby([month, df["Category"]], dropna=False, observed=True).agg(**{
+        column_ut_fra_konto: (column_ut_fra_konto, "sum"),
+        column_inn_pa_konto: (column_inn_pa_konto, "sum"),
+        "Count": (column_ut_fra_konto, "size"),
+    })
+    return period_totals.reset_index()
+
+# Function to roll monthly aggregates up to coarser periods
+def rollup_periods(period_totals, freq=None):
+    """
+    Roll monthly aggregates up to quarters ("Q") or years ("Y").
+    With freq None the result holds the all-time totals per category.
+    """
+    measures = [column_ut_fra_konto, column_inn_pa_konto, "Count"]
+    if freq is None:
+        return period_totals.groupby("Category", observed=True)[measures].sum().reset_index()
+
+    period = period_totals["Month"].dt.asfreq(freq).rename("Period")
+    return period_totals.groupby([period, period_totals["Category"]], dropna=False, observed=True)[measures].sum().reset_index()
 
 # Function to create budget Excel file
 def create_budget_excel(output_file, df):
     """
     Create an Excel file summarizing the totals for each category.
     """
-    # Clean category names
-    df = clean_category_names(df)
+    write_budget_excel(output_file, aggregate_periods(df))
 
-    # Aggregate totals
-    if "Category" in df.columns and "Ut fra konto" in df.columns:
-        ut_fra_konto_totals = df.groupby("Category")["Ut fra konto"].sum().to_dict()
-    else:
-        raise ValueError("The required columns ('Category' and 'Ut fra konto') are missing.")
-
-    if "Category" in df.columns and "Inn på konto" in df.columns:
-        inn_pa_konto_totals = df.groupby("Category")["Inn på konto"].sum().to_dict()
-    else:
-        raise ValueError("The required columns ('Category' and 'Inn på konto') are missing.")
+def write_totals_sheet(workbook, title, totals):
+    """
+    Add a sheet with one row per category and a bold total row to a write-only workbook.
+    The totals are given in øre and written in kroner.
+    """
+    sheet = workbook.create_sheet(title)
 
-    # Create a new workbook
-    workbook = openpyxl.Workbook()
-    sheet = workbook.active
-    sheet.title = "Totals"  # Change the sheet title to "Totals"
+    def bold_row(values):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.font = Font(bold=True)
+            cells.append(cell)
+        return cells
 
     # Add headers
-    sheet["A1"] = "Category"
-    sheet["B1"] = "Ut fra konto"
-    sheet["C1"] = "Inn på konto"
-    sheet["A1"].font = Font(bold=True)
-    sheet["B1"].font = Font(bold=True)
-    sheet["C1"].font = Font(bold=True)
+    sheet.append(bold_row(["Category", "Ut fra konto", "Inn på konto"]))
 
     # Populate the spreadsheet
-    all_categories = set(ut_fra_konto_totals.keys()).union(inn_pa_konto_totals.keys())
-    total_ut_fra_konto = 0
-    total_inn_pa_konto = 0
-
-    for row, category in enumerate(sorted(all_categories), start=2):
-        sheet[f"A{row}"] = category
-        sheet[f"B{row}"] = ut_fra_konto_totals.get(category, 0)
-        sheet[f"C{row}"] = inn_pa_konto_totals.get(category, 0)
-        total_ut_fra_konto += ut_fra_konto_totals.get(category, 0)
-        total_inn_pa_konto += inn_pa_konto_totals.get(category, 0)
+    totals = totals.sort_values("Category")
+    for category, ut, inn in zip(totals["Category"].astype(str), totals[column_ut_fra_konto], totals[column_inn_pa_konto]):
+        sheet.append([category, ut / amount_scale, inn / amount_scale])
 
     # Add total row
-    total_row = len(all_categories) + 2
-    sheet[f"A{total_row}"] = "Total"
-    sheet[f"B{total_row}"] = total_ut_fra_konto
-    sheet[f"C{total_row}"] = total_inn_pa_konto
-    sheet[f"A{total_row}"].font = Font(bold=True)
-    sheet[f"B{total_row}"].font = Font(bold=True)
-    sheet[f"C{total_row}"].font = Font(bold=True)
+    sheet.append(bold_row(["Total", totals[column_ut_fra_konto].sum() / amount_scale,
+                           totals[column_inn_pa_konto].sum() / amount_scale]))
+
+def write_accounts_sheet(workbook, account_totals):
+    """
+    Add a sheet with the totals, count and smallest and largest amount per account and category.
+    The amounts are given in kroner.
+    """
+    sheet = workbook.create_sheet("Accounts")
+    header = []
+    for value in account_totals.columns:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+    for row in account_totals.itertuples(index=False):
+        # A column without amounts has no minimum or maximum, the cell is left empty
+        sheet.append([None if pd.isna(value) else value for value in row])
+
+def write_budget_excel(output_file, period_totals, account_totals=None):
+    """
+    Write the all-time totals and one sheet per year, quarter and month, from monthly aggregates, to an Excel file.
+    With account_totals given, an Accounts sheet drills the totals down per account.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    write_totals_sheet(workbook, "Totals", rollup_periods(period_totals))
+    if account_totals is not None:
+        write_accounts_sheet(workbook, account_totals)
+
+    # Years and quarters are rolled up from the months, rows without a date only count in the totals
+    monthly = period_totals.dropna(subset=["Month"])
+    for freq in ("Y", "Q"):
+        for period, period_rows in rollup_periods(monthly, freq).groupby("Period"):
+            write_totals_sheet(workbook, str(period), period_rows)
+    for month, month_totals in monthly.groupby("Month"):
+        write_totals_sheet(workbook, str(month), month_totals)
 
     # Save the workbook
     workbook.save(output_file)
     print(f"Totals spreadsheet saved to {output_file}")
 
 # Function to open the Budget Creator window
-def open_budget_creator():
+def open_budget_creator(root):
     """Open the Budget Creator window."""
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+
     # Create a new window
     budget_window = tk.Toplevel(root)
     budget_window.title("Budget Creator")
@@ -160,14 +408,16 @@ def open_budget_creator():
     tree.column("Inn på konto", width=150)
     tree.pack(fill=tk.BOTH, expand=True)
 
-    # Load data from Totals.xlsx
+    # Load the totals merged from the partial aggregates in the ledger, or from Totals.xlsx if there is none
     try:
-        totals_file = os.path.join(output_folder, "Totals.xlsx")
-        if not os.path.exists(totals_file):
-            raise FileNotFoundError("Totals.xlsx not found. Please run the program first.")
+        df = load_category_totals(os.path.join(output_folder, "ledger.sqlite"))
+        if df is None:
+            totals_file = os.path.join(output_folder, "Totals.xlsx")
+            if not os.path.exists(totals_file):
+                raise FileNotFoundError("Totals.xlsx not found. Please run the program first.")
 
-        # Read the Excel file
-        df = pd.read_excel(totals_file, engine="openpyxl")
+            # Read the Excel file
+            df = pd.read_excel(totals_file, engine="openpyxl")
 
         # Insert data into the Treeview
         for _, row in df.iterrows():
@@ -180,6 +430,14 @@ def open_budget_creator():
     question_label = tk.Label(budget_window, text="How much do you want to spend on:", font=("Arial", 14))
     question_label.pack(pady=10)
 
+    # Add the month the budget is for
+    month_frame = tk.Frame(budget_window)
+    month_frame.pack()
+    tk.Label(month_frame, text="Month (YYYY-MM):", font=("Arial", 12)).pack(side=tk.LEFT)
+    month_entry = tk.Entry(month_frame, width=10, font=("Arial", 12))
+    month_entry.insert(0, current_month())
+    month_entry.pack(side=tk.LEFT, padx=5)
+
     # Create a scrollable frame for the input fields
     scrollable_frame = tk.Frame(budget_window)
     scrollable_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -207,8 +465,8 @@ def open_budget_creator():
     canvas.bind_all("<Button-4>", lambda e: canvas.yview_scroll(-1, "units"))  # For Linux
     canvas.bind_all("<Button-5>", lambda e: canvas.yview_scroll(1, "units"))  # For Linux
 
-    # Load categories from categories.py
-    from categories import categories
+    # Load the categories from the rules file
+    categories = load_categories()
 
     # Create input fields for each category
     input_fields = {}  # Dictionary to store input fields for each category
@@ -226,13 +484,30 @@ def open_budget_creator():
 
     # Add a button to save the budget inputs
     def save_budget():
-        budget_data = {}
-        for category, entry in input_fields.items():
-            value = entry.get()
-            budget_data[category] = value
-
-        # Display the saved budget data (you can save it to a file or process it further)
-        messagebox.showinfo("Budget Saved", f"Budget data saved:\n{budget_data}")
+        try:
+            month = parse_month(month_entry.get())
+            budget_data = {category: parse_amount(entry.get()) for category, entry in input_fields.items()}
+        except ValueError as e:
+            messagebox.showerror("Error", f"Invalid budget: {e}")
+            return
+        ledger_file = os.path.join(output_folder, "ledger.sqlite")
+        if not os.path.exists(ledger_file):
+            messagebox.showerror("Error", "ledger.sqlite not found. Please run the program first.")
+            return
+
+        # Store the budget in the ledger and show how the month compares to it
+        connection = open_ledger(ledger_file)
+        try:
+            save_budgets(connection, month, budget_data)
+            variance = query_budget_variance(connection, month)
+        except sqlite3.OperationalError as e:
+            messagebox.showerror("Error", f"Failed to save the budget, the ledger is busy: {e}")
+            return
+        finally:
+            connection.close()
+        lines = [f"{row.Category}: {row.Actual:.2f} of {row.Budget:.2f}, {row.Variance:.2f} left"
+                 for row in variance.itertuples() if row.Budget]
+        messagebox.showinfo("Budget Saved", f"Budget for {month} saved:\n" + "\n".join(lines))
 
     # Add a frame for the buttons
     button_frame = tk.Frame(budget_window)
@@ -246,52 +521,499 @@ def open_budget_creator():
     back_button = tk.Button(button_frame, text="Back", command=budget_window.destroy, width=15, height=2)
     back_button.pack(side=tk.LEFT, padx=5)
 
-# Main processing
-combined_df = pd.DataFrame()
+# Function to clean the columns and amounts of a statement
+def clean_statement(df):
+    """
+    Strip column names and text, name the first column Kontonummer and convert the rest to the in-memory schema.
 
-for filename in os.listdir(input_folder):
-    if filename.endswith(".xlsx"):
-        input_file_path = os.path.join(input_folder, filename)
-        output_file = os.path.join(output_folder, f"cleaned_{os.path.splitext(filename)[0]}.csv")
+    The account is only kept to tell the transactions of different accounts apart,
+    process_statement drops it.
+    """
+    # An empty sheet becomes a statement without rows with the usual columns
+    if not len(df.columns):
+        df = pd.DataFrame(columns=[column_kontonummer, column_dato, column_forklaring, column_rentedato,
+                                   column_ut_fra_konto, column_inn_pa_konto])
+    df.columns = df.columns.str.strip()
+    df = df.rename(columns={df.columns[0]: column_kontonummer})
+    for col in df.select_dtypes(include=["object"]).columns:
+        df[col] = df[col].str.strip()
+    return apply_schema(df)
+
+# Function to read and clean a bank statement
+def read_statement(input_file_path):
+    """
+    Read a bank statement and clean its columns and amounts.
+    """
+    df = pd.read_excel(input_file_path, engine="openpyxl")
+    return clean_statement(df)
 
-        df = pd.read_excel(input_file_path, engine="openpyxl")
-        df.columns = df.columns.str.strip()
-        df = df.iloc[:, 1:]
-        for col in df.select_dtypes(include=["object"]).columns:
-            df[col] = df[col].str.strip()
-        df[column_ut_fra_konto] = pd.to_numeric(df[column_ut_fra_konto], errors="coerce").fillna(0)
-        df[column_inn_pa_konto] = pd.to_numeric(df[column_inn_pa_konto], errors="coerce").fillna(0)
+# Function to read a bank statement in chunks
+def iter_statement_chunks(input_file_path, chunk_size):
+    """
+    Read a bank statement row by row with openpyxl in read-only mode.
 
-        df = categorize_entries(df, column_forklaring, categories)
-        find_similar_names(df, column_forklaring)
+    Yields frames of at most chunk_size rows, so memory use does not grow with
+    the size of the workbook. The frames still have to be cleaned with
+    clean_statement. Blank rows at the end of the sheet are skipped, as
+    pd.read_excel does. A sheet without rows yields one empty frame, like
+    pd.read_excel returns.
+    """
+    workbook = openpyxl.load_workbook(input_file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            yield pd.DataFrame()
+            return
+        columns = pd.Index([
+            f"Unnamed: {index}" if name is None else str(name) for index, name in enumerate(header)
+        ])
+
+        chunk = []
+        blank_rows = []
+        yielded = False
+        for row in rows:
+            row = tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row))
+            if all(value is None for value in row):
+                blank_rows.append(row)
+                continue
+            chunk.extend(blank_rows)
+            blank_rows = []
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                yielded = True
+                chunk = []
+
+        if chunk or not yielded:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        workbook.close()
+
+# Function to read a bank statement in chunks or in one piece
+def iter_statement_frames(input_file_path, chunk_size=None):
+    """
+    Yield the uncleaned frames of a statement, in chunks of chunk_size rows or as one frame.
+    """
+    if chunk_size:
+        yield from iter_statement_chunks(input_file_path, chunk_size)
+    else:
+        yield pd.read_excel(input_file_path, engine="openpyxl")
 
-        # Filter out "Kontooverføringer" category
-        df = df[df["Category"] != "Kontooverføringer"]
+# Function to read a bank statement into a cleaned artifact
+def write_cleaned_statement(input_file_path, artifact_path, chunk_size=None):
+    """
+    Read and clean a statement and store it as a stream of frames.
 
-        if combine_output:
-            combined_df = pd.concat([combined_df, df], ignore_index=True)
-        else:
-            df.to_csv(output_file, index=False, sep=",", encoding="utf-8")
-            print(f"Processed and saved: {output_file}")
+    With a chunk_size the workbook is streamed in chunks of that many rows,
+    otherwise it is read in one piece. Returns the stage measurements of the
+    file, as this may run in a worker process.
+    """
+    run_report = start_run_report()
+    # The artifact exists even when the statement has no rows
+    open(artifact_path, "wb").close()
+
+    frames = iter_statement_frames(input_file_path, chunk_size)
+    while True:
+        with measure_stage(run_report, "read_statement") as record:
+            df = next(frames, None)
+            record["rows"] += 0 if df is None else len(df)
+        if df is None:
+            break
+        with measure_stage(run_report, "clean_statement", rows=len(df)):
+            df = clean_statement(df)
+        with measure_stage(run_report, "write_artifacts", rows=len(df)):
+            append_frame(artifact_path, df)
+    return run_report["run"]["stages"]
+
+# Function to load the current categories
+def load_categories():
+    """
+    Return the categories from the rules file, reloaded only when it changed since they were last read.
+    """
+    return current_rules()["categories"]
+
+# Function to categorize and deduplicate a cleaned statement
+def process_statement(df, rules, cache=None, run_report=None, filename=None, rule_stats=None, name_mapping=None):
+    """
+    Categorize a cleaned statement with the compiled rules, merge similar names and drop account transfers.
+
+    The time of each step is added to run_report and the rule hits to rule_stats when they are given.
+    name_mapping holds the canonical names of the whole statement when df is one of its chunks.
+    """
+    with measure_stage(run_report, "normalize_merchants", filename, len(df)):
+        merchants = normalize_merchants(df[column_forklaring])
+    with measure_stage(run_report, "categorize_entries", filename, len(df)):
+        df = categorize_entries(df, column_forklaring, rules["categories"], cache, merchants, rules, rule_stats)
+    with measure_stage(run_report, "find_similar_names", filename, len(df)):
+        find_similar_names(df, column_forklaring, cache=cache, mapping=name_mapping)
+
+    # Filter out "Kontooverføringer" category
+    df = df[df["Category"] != "Kontooverføringer"]
+    return df.drop(columns=column_kontonummer, errors="ignore")
+
+# Function to read several statements, in parallel when there is more than one
+def write_cleaned_statements(file_paths, artifact_paths, workers=None, chunk_size=None):
+    """
+    Read and clean statements into their artifacts in a process pool.
+
+    Yields the stage measurements of each statement in the order of file_paths while the
+    remaining files are still being parsed. With a single worker or a single
+    file the statements are read one by one in this process.
+    """
+    if workers is None:
+        workers = parse_workers
+    if chunk_size is None:
+        chunk_size = statement_chunk_size
+    if workers == 1 or len(file_paths) < 2:
+        for file_path, artifact_path in zip(file_paths, artifact_paths):
+            yield write_cleaned_statement(file_path, artifact_path, chunk_size)
+        return
+
+    # Pending files are dropped if the caller stops early, e.g. when a run is cancelled
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(parse_start_method))
+    try:
+        yield from executor.map(write_cleaned_statement, file_paths, artifact_paths, [chunk_size] * len(file_paths))
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+class PipelineCancelled(Exception):
+    """Raised when a pipeline run is cancelled."""
+
+def check_cancelled(cancel_event):
+    """Raise PipelineCancelled if the cancel event is set."""
+    if cancel_event is not None and cancel_event.is_set():
+        raise PipelineCancelled("The run was cancelled.")
+
+# Function to run the whole pipeline
+def run_pipeline(input_folder=input_folder, output_folder=output_folder, cache_folder=cache_folder,
+                 combine=None, workers=None, chunk_size=None, categories=None, cache=None,
+                 progress=None, cancel_event=None, profile=None):
+    """
+    Clean, categorize and deduplicate every statement in the input folder and write the outputs.
+
+    Importing this module has no side effects, so the GUI can call this function
+    in-process. Pass the cache returned by a previous run to reuse it without
+    reading it from disk again. Returns a summary of the run.
+
+    Rows of a statement that already appeared in an earlier statement, in
+    filename order, are dropped, so overlapping exports are not counted twice.
+    The number of dropped rows per file is in the summary.
+
+    progress is called with a dictionary holding the stage, the file, and the
+    number of steps done out of the total. Setting cancel_event stops the run
+    with PipelineCancelled between chunks. The outputs of the previous run are
+    then left in place.
+
+    Wall time, CPU time, growth of the peak memory and rows of every stage and
+    file are written to run_report.json in the output folder, also when the run
+    fails or is cancelled. With profile set, cProfile and tracemalloc data, with
+    the traced peak memory of every stage, is added and the statements are
+    parsed in this process, so the profile covers them.
+
+    The hits of every category and keyword in the current statements, the rows
+    matched by several categories and the keywords that matched nothing are
+    written to rule_report.json in the output folder.
+
+    combined_output.csv and combined_output.parquet are written from the ledger,
+    with the categories set by hand and learned from them, like Totals.xlsx. The
+    cleaned file of each statement written with combine off shows the categories
+    of the rules.
+    """
+    if combine is None:
+        combine = combine_output
+    if profile is None:
+        profile = profile_run
+    if profile:
+        workers = 1
+    run_report = start_run_report(profile)
+    run_status = "failed"
+    # Categories passed in are compiled with the default rule options
+    rules = make_rules(categories) if categories is not None else current_rules()
+    categories = rules["categories"]
+
+    cache_file = os.path.join(cache_folder, "category_cache.json")
+    manifest_file = os.path.join(cache_folder, "manifest.json")
+    statements_folder = os.path.join(cache_folder, "statements")
+    ledger_file = os.path.join(output_folder, "ledger.sqlite")
+    results_folder = os.path.join(cache_folder, "results")
+
+    # Ensure folders exist
+    os.makedirs(output_folder, exist_ok=True)
+    os.makedirs(statements_folder, exist_ok=True)
 
-if combine_output:
     combined_output_file = os.path.join(output_folder, "combined_output.csv")
-    combined_df.to_csv(combined_output_file, index=False, sep=",", encoding="utf-8")
-    print(f"Processed and saved combined output: {combined_output_file}")
+    combined_store_file = os.path.join(output_folder, "combined_output.parquet")
+
+    # Fingerprints of the rows of the statements read so far, to drop the overlap of later exports
+    seen_fingerprints = set()
+    statements_read = ""
+    duplicates = {}
+    # Rule hits of every statement, merged into the rule report
+    rule_hits = new_rule_stats()
+
+    with measure_stage(run_report, "load_caches"):
+        if cache is None:
+            cache = load_cache(cache_file, categories)
+        else:
+            refresh_cache(cache, categories)
+        manifest = load_manifest(manifest_file)
+        # Without a ledger every statement has to be loaded into a new one
+        ledger_exists = os.path.exists(ledger_file)
+        ledger = open_ledger(ledger_file)
+
+    input_files = sorted(filename for filename in os.listdir(input_folder) if filename.endswith(".xlsx"))
+    remove_statements(ledger, remove_missing_files(manifest, input_files, statements_folder))
+
+    # Parse the new or changed files in parallel, the results are consumed in filename order below
+    with measure_stage(run_report, "check_manifest"):
+        unchanged_entries = {
+            filename: get_unchanged_entry(manifest, filename, os.path.join(input_folder, filename))
+            for filename in input_files
+        }
+    # Artifacts written with an older in-memory schema are parsed again
+    for filename, entry in unchanged_entries.items():
+        if entry is not None and entry.get("schema") != schema_version:
+            unchanged_entries[filename] = None
+    changed_files = [filename for filename in input_files if unchanged_entries[filename] is None]
+    parsed_statements = write_cleaned_statements(
+        [os.path.join(input_folder, filename) for filename in changed_files],
+        [os.path.join(statements_folder, f"{os.path.splitext(filename)[0]}_cleaned.pkl") for filename in changed_files],
+        workers,
+        chunk_size,
+    )
 
-    # Clean category names before generating the budget Excel file
-    budget_output_file = os.path.join(output_folder, "Totals.xlsx")
-    combined_df = clean_category_names(combined_df)
-    create_budget_excel(budget_output_file, combined_df)
+    def report(stage, filename=None, done=0):
+        if progress is not None:
+            progress({"stage": stage, "file": filename, "done": done, "total": len(input_files) + 1})
 
-# Create the main window
-root = tk.Tk()
-root.title("Main Window")
-root.geometry("400x400")
+    # The combined outputs are written to temporary files and only replace the old ones when complete
+    if combine:
+        combined_output = open(combined_output_file + ".tmp", "w", encoding="utf-8", newline="")
+        combined_store = open_store_writer(combined_store_file + ".tmp")
+
+    completed = False
+    try:
+        for file_index, filename in enumerate(input_files):
+            check_cancelled(cancel_event)
+            input_file_path = os.path.join(input_folder, filename)
+            output_file = os.path.join(output_folder, f"cleaned_{os.path.splitext(filename)[0]}.csv")
+            cleaned_artifact = f"{os.path.splitext(filename)[0]}_cleaned.pkl"
+            fingerprints_artifact = f"{os.path.splitext(filename)[0]}_fingerprints.pkl"
+            fingerprints_path = os.path.join(statements_folder, fingerprints_artifact)
+
+            # Only parse files that are new or changed, and only recategorize when the categories
+            # or the statements before it changed, as those decide which rows are duplicates
+            entry = unchanged_entries[filename]
+            if (entry is not None and entry.get("rules_version") == rules["version"] and ledger_exists
+                    and entry.get("earlier_statements") == statements_read and entry.get("fingerprints")
+                    and "rule_stats" in entry):
+                print(f"Unchanged, using cached result: {filename}")
+                mark_file_cached(run_report, filename)
+                seen_fingerprints.update(pd.read_pickle(fingerprints_path).tolist())
+                duplicates[filename] = entry.get("duplicates", 0)
+                merge_rule_stats(rule_hits, entry["rule_stats"])
+            else:
+                if entry is None:
+                    report("parse", filename, file_index)
+                    merge_file_measurements(run_report, filename, next(parsed_statements))
+                report("categorize", filename, file_index)
+
+                # Stream the cleaned chunks through categorization into the ledger and the CSV writer
+                batch = new_batch()
+                first_row = 0
+                occurrences = {}
+                file_fingerprints = []
+                duplicates[filename] = 0
+                file_rule_stats = new_rule_stats()
+
+                # The duplicates and the similar names are decided for the whole statement first,
+                # so the output does not depend on the chunk size
+                duplicate_masks = []
+                statement_names = {}
+                for chunk in read_frames(os.path.join(statements_folder, cleaned_artifact)):
+                    check_cancelled(cancel_event)
+                    with measure_stage(run_report, "drop_duplicates", filename, len(chunk)):
+                        fingerprints = row_fingerprints(chunk, occurrences)
+                        is_duplicate = find_duplicates(fingerprints, seen_fingerprints)
+                        file_fingerprints.append(fingerprints)
+                        duplicate_masks.append(is_duplicate)
+                        duplicates[filename] += int(is_duplicate.sum())
+                    statement_names.update(dict.fromkeys(chunk.loc[~is_duplicate, column_forklaring].unique()))
+                with measure_stage(run_report, "group_similar_names", filename, len(statement_names)):
+                    name_mapping = similar_name_mapping(statement_names, cache=cache)[0]
+
+                for chunk_index, (chunk, is_duplicate) in enumerate(
+                        zip(read_frames(os.path.join(statements_folder, cleaned_artifact)), duplicate_masks)):
+                    check_cancelled(cancel_event)
+                    df = process_statement(chunk[~is_duplicate], rules, cache, run_report, filename, file_rule_stats,
+                                           name_mapping)
+                    with measure_stage(run_report, "write_ledger", filename, len(df)):
+                        upsert_transactions(ledger, filename, df, first_row, batch)
+                    first_row += len(chunk)
+
+                    if not combine:
+                        with measure_stage(run_report, "write_csv", filename, len(df)):
+                            to_output_frame(df).to_csv(output_file, mode="w" if chunk_index == 0 else "a",
+                                                       header=chunk_index == 0, index=False, sep=",", encoding="utf-8")
+
+                # The rows of the statement are committed to the ledger in one transaction
+                with measure_stage(run_report, "write_ledger", filename):
+                    finish_statement(ledger, filename, batch)
+                pd.concat(file_fingerprints, ignore_index=True).to_pickle(fingerprints_path)
+                if duplicates[filename]:
+                    print(f"Dropped {duplicates[filename]} rows already in an earlier statement: {filename}")
+
+                record_file(manifest, filename, input_file_path, {
+                    "cleaned": cleaned_artifact,
+                    "fingerprints": fingerprints_artifact,
+                    "rules_version": rules["version"],
+                    "schema": schema_version,
+                    "earlier_statements": statements_read,
+                    "duplicates": duplicates[filename],
+                    "rule_stats": file_rule_stats,
+                })
+                merge_rule_stats(rule_hits, file_rule_stats)
+                if not combine:
+                    print(f"Processed and saved: {output_file}")
+
+            statements_read = statements_key(statements_read, filename, manifest["files"][filename]["hash"])
+
+        # Categorize the merchants the rules missed like the nearest merchant corrected by hand
+        with measure_stage(run_report, "learned_categories"):
+            learned = apply_learned_categories(ledger)
+        if learned:
+            print(f"Categorized {learned} rows like merchants corrected by hand")
+
+        # The combined outputs are written from the ledger, so they show the categories set by hand
+        # and learned from them, like Totals.xlsx
+        if combine:
+            report("write", None, len(input_files))
+            for chunk_index, df in enumerate(read_transaction_frames(ledger)):
+                check_cancelled(cancel_event)
+                with measure_stage(run_report, "write_csv", rows=len(df)):
+                    to_output_frame(df).to_csv(combined_output, index=False, header=chunk_index == 0, sep=",")
+                with measure_stage(run_report, "write_store", rows=len(df)):
+                    write_store_chunk(combined_store, df)
+
+        # Publish the ledger as a memory-mappable file for the windows of the GUI
+        with measure_stage(run_report, "publish_results"):
+            publish_results(ledger, results_folder, new_batch())
+
+        # Report how often every category and keyword matched the current statements
+        with measure_stage(run_report, "rule_report"):
+            rule_report = build_rule_report(rule_hits, categories)
+            rule_report_file = save_rule_report(rule_report, output_folder)
+        print(format_rule_report(rule_report))
+        print(f"Rule report saved: {rule_report_file}")
+        completed = True
+    except PipelineCancelled:
+        run_status = "cancelled"
+        raise
+    finally:
+        parsed_statements.close()
+        if combine:
+            combined_output.close()
+            if combined_store is not None:
+                combined_store.close()
+            for output_file in (combined_output_file, combined_store_file):
+                if not os.path.exists(output_file + ".tmp"):
+                    continue
+                if completed:
+                    os.replace(output_file + ".tmp", output_file)
+                else:
+                    os.remove(output_file + ".tmp")
+
+        # A statement left half written by a cancellation is rolled back
+        ledger.rollback()
+
+        # Files finished before a cancellation keep their cached results
+        with measure_stage(run_report, "save_caches"):
+            save_manifest(manifest, manifest_file)
+            save_cache(cache, cache_file)
+        if not completed:
+            ledger.close()
+            save_run_report(finish_run_report(run_report, run_status), output_folder)
+
+    period_totals = None
+    if combine:
+        report("totals", None, len(input_files))
+        print(f"Processed and saved combined output: {combined_output_file}")
+        if combined_store is not None:
+            print(f"Processed and saved columnar output: {combined_store_file}")
+
+        # Write the monthly totals merged from the partial aggregates of every statement
+        try:
+            with measure_stage(run_report, "write_totals"):
+                period_totals = query_period_totals(ledger)
+                budget_output_file = os.path.join(output_folder, "Totals.xlsx")
+                write_budget_excel(budget_output_file, period_totals, query_account_totals(ledger))
+        except Exception:
+            save_run_report(finish_run_report(run_report, "failed"), output_folder)
+            raise
+        finally:
+            ledger.close()
+    else:
+        ledger.close()
+
+    finish_run_report(run_report, "completed")
+    run_report_file = save_run_report(run_report, output_folder)
+    print(format_run_report(run_report))
+    print(f"Run report saved: {run_report_file}")
+
+    report("done", None, len(input_files) + 1)
+    return {
+        "files": input_files,
+        "processed": changed_files,
+        "cache": cache,
+        "period_totals": period_totals,
+        "duplicates": duplicates,
+        "rule_report": rule_report,
+        "run_report": run_report,
+    }
+
+# Function to open the main window
+def open_main_window():
+    """Open the main window with a button for the Budget Creator."""
+    import tkinter as tk
+
+    # Create the main window
+    root = tk.Tk()
+    root.title("Main Window")
+    root.geometry("400x400")
+
+    # Add a button to open the Budget Creator
+    open_budget_button = tk.Button(root, text="Open Budget Creator", command=lambda: open_budget_creator(root), width=20, height=2)
+    open_budget_button.pack(pady=20)
+
+    # Run the main loop
+    root.mainloop()
+
+def main(argv=None):
+    """Command line entry point, also usable headless from cron or batch jobs."""
+    parser = argparse.ArgumentParser(description="Clean, categorize and total bank statements.")
+    parser.add_argument("--headless", action="store_true", help="process the statements without opening the window")
+    parser.add_argument("--input-folder", default=input_folder, help="folder with the .xlsx statements")
+    parser.add_argument("--output-folder", default=output_folder, help="folder for the cleaned output")
+    parser.add_argument("--cache-folder", default=cache_folder, help="folder for the caches and intermediate files")
+    parser.add_argument("--separate", action="store_true", help="write one cleaned file per statement instead of a combined output")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes used to parse statements")
+    parser.add_argument("--chunk-size", type=int, default=None, help="read statements in chunks of this many rows")
+    parser.add_argument("--profile", action="store_true", help="add cProfile and tracemalloc data to the run report")
+    args = parser.parse_args(argv)
+
+    run_pipeline(
+        input_folder=args.input_folder,
+        output_folder=args.output_folder,
+        cache_folder=args.cache_folder,
+        combine=0 if args.separate else None,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        profile=True if args.profile else None,
+    )
 
-# Add a button to open the Budget Creator
-open_budget_button = tk.Button(root, text="Open Budget Creator", command=open_budget_creator, width=20, height=2)
-open_budget_button.pack(pady=20)
+    if not args.headless:
+        open_main_window()
 
-# Run the main loop
-root.mainloop()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
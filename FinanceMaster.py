@@ -1,36 +1,81 @@
 import os
 import shutil
+import sqlite3
+import bisect
 import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-import subprocess
 import webbrowser
 import threading
+import queue
+import json
 import pandas as pd
-from categories import categories  # Import categories from categories.py
+from category_rules import current_rules, save_rules
+from category_cache import invalidate_cache_file
+from ledger import open_ledger, load_category_totals, load_accounts, query_uncategorized, recategorize_merchants
+from CleanDataKontoutskrift import run_pipeline, load_categories, PipelineCancelled
+from stage_profiler import format_run_report
+from rule_stats import format_rule_report
+from folder_watcher import start_watch, poll_watch
+from category_suggestions import suggest_categories, apply_learned_categories
+from result_cache import publish_results, result_uncategorized
+from budgets import (
+    current_month, parse_month, parse_amount, save_budgets, query_budgets, query_budget_months, query_budget_variance,
+)
 
 # Define paths
 base_folder = os.path.dirname(os.path.abspath(__file__))
 input_folder = os.path.join(base_folder, "InputFolder")
 output_folder = os.path.join(base_folder, "OutputFolder")
+cache_file = os.path.join(base_folder, "CacheFolder", "category_cache.json")
+ledger_file = os.path.join(output_folder, "ledger.sqlite")
+results_folder = os.path.join(base_folder, "CacheFolder", "results")
+run_report_file = os.path.join(output_folder, "run_report.json")
+rule_report_file = os.path.join(output_folder, "rule_report.json")
 
 # Ensure folders exist
 os.makedirs(input_folder, exist_ok=True)
 os.makedirs(output_folder, exist_ok=True)
 
+# Description cache kept in memory between runs of the pipeline
+pipeline_cache = None
+
+# Background worker state: queued runs, events for the GUI and cancellation
+job_queue = queue.Queue()
+event_queue = queue.Queue()
+run_pending = threading.Event()
+cancel_event = threading.Event()
+
+# Watching InputFolder for new statements
+watch_input_folder = 0  # Set to 1 to process new statements in InputFolder automatically
+watch_interval_ms = 2000  # How often InputFolder is checked
+watch_settle_seconds = 3  # New files are processed once InputFolder has not changed for this long
+input_watch = None
+
+def sync_listbox(listbox, names):
+    """Show the given names sorted in a listbox, only deleting and inserting the differences."""
+    names = set(names)
+    current = listbox.get(0, tk.END)
+
+    # Delete from the end so the indexes of the remaining items stay valid
+    for index in range(len(current) - 1, -1, -1):
+        if current[index] not in names:
+            listbox.delete(index)
+
+    current = list(listbox.get(0, tk.END))
+    for name in sorted(names - set(current)):
+        index = bisect.bisect(current, name)
+        listbox.insert(index, name)
+        current.insert(index, name)
+
 def update_file_lists():
     """Update the input and output file lists."""
-    input_listbox.delete(0, tk.END)
-    output_listbox.delete(0, tk.END)
-
     # List files in InputFolder
-    for file in os.listdir(input_folder):
-        input_listbox.insert(tk.END, file)
+    sync_listbox(input_listbox, os.listdir(input_folder))
 
     # List files in OutputFolder
     output_files = os.listdir(output_folder)
-    for file in output_files:
-        output_listbox.insert(tk.END, file)
+    sync_listbox(output_listbox, output_files)
 
     # Enable or disable the Budget Creator button based on output files
     if output_files:
@@ -50,27 +95,129 @@ def upload_files():
         messagebox.showinfo("Success", f"{len(files)} file(s) uploaded to InputFolder.")
         update_file_lists()
 
-def run_program():
-    """Run the main program and update the output file list."""
-    def process():
+def pipeline_worker():
+    """Run queued pipeline jobs one at a time and pass their progress to the GUI."""
+    global pipeline_cache
+    while True:
+        job = job_queue.get()
+        run_pending.clear()
+        cancel_event.clear()
         try:
-            # Start the progress bar
-            progress_bar.start()
-
-            # Run the main program (CleanDataKontoutskrift.py)
-            subprocess.run(["python", "CleanDataKontoutskrift.py"], check=True)
-            messagebox.showinfo("Success", "Program executed successfully!")
-            update_file_lists()
-        except subprocess.CalledProcessError as e:
-            messagebox.showerror("Error", f"Program execution failed: {e}")
+            # Run the pipeline in this process, reusing the description cache of the previous run
+            result = run_pipeline(
+                input_folder=input_folder,
+                output_folder=output_folder,
+                cache=pipeline_cache,
+                progress=lambda event: event_queue.put(("progress", event)),
+                cancel_event=cancel_event,
+                profile=job["profile"] or None,
+            )
+            pipeline_cache = result["cache"]
+            event_queue.put(("done", result))
+        except PipelineCancelled:
+            event_queue.put(("cancelled", None))
         except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+            event_queue.put(("error", e))
         finally:
-            # Stop the progress bar
-            progress_bar.stop()
+            job_queue.task_done()
 
-    # Run the process in a separate thread to avoid freezing the GUI
-    threading.Thread(target=process).start()
+def poll_pipeline_events():
+    """Apply the progress events of the worker to the GUI, from the Tk thread."""
+    try:
+        while True:
+            kind, payload = event_queue.get_nowait()
+            if kind == "progress":
+                progress_bar.config(maximum=payload["total"], value=payload["done"])
+                status_label.config(text=f"{payload['stage'].capitalize()}: {payload['file'] or ''}")
+            elif kind == "done":
+                progress_bar.config(value=progress_bar["maximum"])
+                status_label.config(text=f"Done in {payload['run_report']['wall_seconds']:.1f} s, "
+                                         f"{len(payload['processed'])} new or changed file(s) processed")
+                update_file_lists()
+                dropped = sum(payload["duplicates"].values())
+                messagebox.showinfo("Success", "Program executed successfully!"
+                                    + (f"\n{dropped} duplicate rows from overlapping statements were dropped." if dropped else ""))
+            elif kind == "cancelled":
+                progress_bar.config(value=0)
+                status_label.config(text="Cancelled")
+                update_file_lists()
+            elif kind == "error":
+                status_label.config(text="Failed")
+                messagebox.showerror("Error", f"An unexpected error occurred: {payload}")
+    except queue.Empty:
+        pass
+    root.after(100, poll_pipeline_events)
+
+def poll_input_folder():
+    """Check InputFolder while watching is on and process new statements once they stop changing."""
+    global input_watch
+    if watch_var.get():
+        if input_watch is None:
+            input_watch = start_watch(input_folder)
+        changes = poll_watch(input_watch, watch_settle_seconds)
+        if changes["added"] or changes["removed"]:
+            sync_listbox(input_listbox, os.listdir(input_folder))
+        if changes["ready"]:
+            status_label.config(text=f"New or changed statements: {', '.join(changes['ready'])}")
+            run_program()
+    else:
+        input_watch = None
+    root.after(watch_interval_ms, poll_input_folder)
+
+def run_program():
+    """Queue a run of the main program, unless one is already waiting to start."""
+    if run_pending.is_set():
+        return
+    run_pending.set()
+    status_label.config(text="Queued")
+    job_queue.put({"profile": profile_var.get()})
+
+def cancel_program():
+    """Cancel the running program."""
+    cancel_event.set()
+    status_label.config(text="Cancelling...")
+
+def open_run_report():
+    """Show a summary of the last run report, slowest stages first."""
+    if not os.path.exists(run_report_file):
+        messagebox.showinfo("Run report", "No run report yet. Run the program first.")
+        return
+    with open(run_report_file, "r", encoding="utf-8") as f:
+        run_report = json.load(f)
+
+    report_window = tk.Toplevel(root)
+    report_window.title("Run Report")
+    report_window.geometry("560x420")
+
+    summary = format_run_report(run_report, top=len(run_report["stages"]))
+    tk.Label(report_window, text=f"Run started {run_report['started']}", font=("Arial", 12)).pack(pady=5)
+    summary_text = tk.Text(report_window, font=("Courier", 10), height=12)
+    summary_text.insert(tk.END, summary + "\n\n")
+
+    # The slowest files, to find the statement that makes a run slow
+    file_times = sorted(
+        ((sum(record["wall_seconds"] for record in file_entry["stages"].values()), filename)
+         for filename, file_entry in run_report["files"].items()),
+        reverse=True,
+    )
+    for seconds, filename in file_times[:10]:
+        summary_text.insert(tk.END, f"{filename:<40} {seconds:8.2f} s\n")
+    if run_report.get("profile_file"):
+        summary_text.insert(tk.END, f"\nProfile saved: {run_report['profile_file']}\n")
+
+    # How the categories matched, to find keywords to prune
+    if os.path.exists(rule_report_file):
+        with open(rule_report_file, "r", encoding="utf-8") as f:
+            rule_report = json.load(f)
+        summary_text.insert(tk.END, "\n" + format_rule_report(rule_report) + "\n")
+        summary_text.insert(tk.END, f"\nRule report saved: {rule_report_file}\n")
+    summary_text.config(state=tk.DISABLED)
+    summary_text.pack(fill=tk.BOTH, expand=True, padx=10, pady=5)
+
+    button_frame = tk.Frame(report_window)
+    button_frame.pack(pady=10)
+    tk.Button(button_frame, text="Open JSON", command=lambda: webbrowser.open(run_report_file), width=15).pack(side=tk.LEFT, padx=5)
+    tk.Button(button_frame, text="Close", command=report_window.destroy, width=15).pack(side=tk.LEFT, padx=5)
 
 def open_file_from_listbox(listbox, folder):
     """Open the selected file from the specified folder."""
@@ -93,6 +240,16 @@ def open_budget_creator():
     # Add a label
     tk.Label(budget_window, text="Budget Creator", font=("Arial", 18)).pack(pady=10)
 
+    # Drill down to the totals of one account (statement)
+    all_accounts = "All accounts"
+    account_frame = tk.Frame(budget_window)
+    account_frame.pack(fill=tk.X, padx=10)
+    tk.Label(account_frame, text="Account:").pack(side=tk.LEFT)
+    account_var = tk.StringVar(value=all_accounts)
+    account_menu = ttk.Combobox(account_frame, textvariable=account_var, state="readonly", width=50,
+                                values=[all_accounts] + load_accounts(ledger_file))
+    account_menu.pack(side=tk.LEFT, padx=5)
+
     # Add a frame for the budget table
     table_frame = tk.Frame(budget_window)
     table_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
@@ -107,35 +264,64 @@ def open_budget_creator():
     tree.column("Inn på konto", width=150)
     tree.pack(fill=tk.BOTH, expand=True)
 
-    # Load data from Totals.xlsx
-    try:
-        totals_file = os.path.join(output_folder, "Totals.xlsx")
-        if not os.path.exists(totals_file):
-            raise FileNotFoundError("Totals.xlsx not found. Please run the program first.")
+    # Load the totals merged from the partial aggregates in the ledger, or from Totals.xlsx if there is none
+    def load_totals(event=None):
+        account = account_var.get()
+        try:
+            df = load_category_totals(ledger_file, None if account == all_accounts else account)
+            if df is None:
+                totals_file = os.path.join(output_folder, "Totals.xlsx")
+                if not os.path.exists(totals_file):
+                    raise FileNotFoundError("Totals.xlsx not found. Please run the program first.")
 
-        # Read the Excel file
-        df = pd.read_excel(totals_file, engine="openpyxl")
+                # Read the Excel file
+                df = pd.read_excel(totals_file, engine="openpyxl")
 
-        # Clear the Treeview before inserting new data (if needed)
-        for item in tree.get_children():
-            tree.delete(item)
+            # Clear the Treeview before inserting new data
+            for item in tree.get_children():
+                tree.delete(item)
 
-        # Insert data into the Treeview
-        for _, row in df.iterrows():
-            tree.insert("", tk.END, values=(row["Category"], row["Ut fra konto"], row["Inn på konto"]))
+            # Insert data into the Treeview
+            for _, row in df.iterrows():
+                tree.insert("", tk.END, values=(row["Category"], row["Ut fra konto"], row["Inn på konto"]))
 
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to load budget data: {e}")
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load budget data: {e}")
+
+    account_menu.bind("<<ComboboxSelected>>", load_totals)
+    load_totals()
+
+    # The budget is entered per month, the stored months are listed newest first
+    month_frame = tk.Frame(budget_window)
+    month_frame.pack(fill=tk.X, padx=10)
+    tk.Label(month_frame, text="Budget month (YYYY-MM):").pack(side=tk.LEFT)
+    month_var = tk.StringVar(value=current_month())
+    # Opening the ledger would create it, so without one there are no months yet
+    months = []
+    if os.path.exists(ledger_file):
+        connection = open_ledger(ledger_file)
+        try:
+            months = query_budget_months(connection)
+        finally:
+            connection.close()
+    month_menu = ttk.Combobox(month_frame, textvariable=month_var, width=10,
+                              values=list(dict.fromkeys([current_month()] + months)))
+    month_menu.pack(side=tk.LEFT, padx=5)
 
     # Add input fields for each category
     scrollable_frame = create_scrollable_frame(budget_window)
-    input_fields = create_category_input_fields(scrollable_frame)
+    input_fields, variance_labels = create_category_input_fields(scrollable_frame)
+
+    month_menu.bind("<<ComboboxSelected>>", lambda event: load_budget(month_var.get(), input_fields, variance_labels))
+    month_menu.bind("<Return>", lambda event: load_budget(month_var.get(), input_fields, variance_labels))
+    load_budget(month_var.get(), input_fields, variance_labels)
 
     # Add buttons
     button_frame = tk.Frame(budget_window)
     button_frame.pack(pady=10)
 
-    tk.Button(button_frame, text="Save Budget", command=lambda: save_budget(input_fields), width=15, height=2).pack(side=tk.LEFT, padx=5)
+    tk.Button(button_frame, text="Save Budget", width=15, height=2,
+              command=lambda: save_budget(month_var.get(), input_fields, variance_labels)).pack(side=tk.LEFT, padx=5)
     tk.Button(button_frame, text="Add Category", command=open_category_manager, width=15, height=2).pack(side=tk.LEFT, padx=5)
     tk.Button(button_frame, text="Back", command=budget_window.destroy, width=15, height=2).pack(side=tk.LEFT, padx=5)
 
@@ -161,19 +347,74 @@ def create_scrollable_frame(parent):
     return content_frame
 
 def create_category_input_fields(parent):
-    """Create input fields for each category."""
+    """Create input fields for each category, with labels for the spending and variance of the month."""
     input_fields = {}
-    for row_index, (category, keywords) in enumerate(categories.items()):
+    variance_labels = {}
+    for column, heading in enumerate(["Category", "Budget", "Actual", "Variance"]):
+        tk.Label(parent, text=heading, font=("Arial", 12, "bold")).grid(row=0, column=column, padx=5, pady=5, sticky="w")
+    for row_index, category in enumerate(current_rules()["categories"], start=1):
         tk.Label(parent, text=f"{category}:", font=("Arial", 12)).grid(row=row_index, column=0, padx=5, pady=5, sticky="w")
         entry = tk.Entry(parent, width=20, font=("Arial", 12))
         entry.grid(row=row_index, column=1, padx=5, pady=5, sticky="w")
         input_fields[category] = entry
-    return input_fields
+        actual_label = tk.Label(parent, font=("Arial", 12))
+        actual_label.grid(row=row_index, column=2, padx=5, pady=5, sticky="e")
+        variance_label = tk.Label(parent, font=("Arial", 12))
+        variance_label.grid(row=row_index, column=3, padx=5, pady=5, sticky="e")
+        variance_labels[category] = (actual_label, variance_label)
+    return input_fields, variance_labels
+
+def show_budget_variance(connection, month, variance_labels):
+    """Show the actual spending and the variance of every category for a month."""
+    variance = query_budget_variance(connection, month).set_index("Category")
+    for category, (actual_label, variance_label) in variance_labels.items():
+        if category in variance.index:
+            actual_label.config(text=f"{variance.at[category, 'Actual']:.2f}")
+            value = variance.at[category, "Variance"]
+            variance_label.config(text=f"{value:.2f}", fg="red" if value < 0 else "dark green")
+        else:
+            actual_label.config(text="")
+            variance_label.config(text="")
 
-def save_budget(input_fields):
-    """Save the budget data entered by the user."""
-    budget_data = {category: entry.get() for category, entry in input_fields.items()}
-    messagebox.showinfo("Budget Saved", f"Budget data saved:\n{budget_data}")
+def load_budget(month, input_fields, variance_labels):
+    """Fill the input fields with the stored budget of a month and show its variance."""
+    if not os.path.exists(ledger_file):
+        return
+    connection = open_ledger(ledger_file)
+    try:
+        budget = query_budgets(connection, month)
+        for category, entry in input_fields.items():
+            entry.delete(0, tk.END)
+            if category in budget:
+                entry.insert(0, f"{budget[category]:.2f}")
+        show_budget_variance(connection, month, variance_labels)
+    finally:
+        connection.close()
+
+def save_budget(month, input_fields, variance_labels):
+    """Store the budget entered for a month in the ledger and show the variance against it."""
+    try:
+        month = parse_month(month)
+        amounts = {category: parse_amount(entry.get()) for category, entry in input_fields.items()}
+    except ValueError as e:
+        messagebox.showerror("Error", f"Invalid budget: {e}")
+        return
+    if not os.path.exists(ledger_file):
+        messagebox.showerror("Error", "ledger.sqlite not found. Please run the program first.")
+        return
+
+    connection = open_ledger(ledger_file)
+    try:
+        save_budgets(connection, month, amounts)
+        show_budget_variance(connection, month, variance_labels)
+    except sqlite3.OperationalError as e:
+        # A run loading statements keeps the ledger locked, the budget can be saved when it is done
+        messagebox.showerror("Error", f"Failed to save the budget, the ledger is busy: {e}")
+        return
+    finally:
+        connection.close()
+    budgeted = sum(1 for amount in amounts.values() if amount is not None)
+    messagebox.showinfo("Budget Saved", f"Budget for {month} saved for {budgeted} categories.")
 
 def open_category_manager():
     """Open the Category Manager window."""
@@ -188,166 +429,272 @@ def open_category_manager():
     scrollable_frame = create_scrollable_frame(category_window)
     category_entries = {}
 
-    # Display existing categories
-    for row_index, (category, keywords) in enumerate(categories.items()):
+    # Display existing categories, with their keywords and priority
+    rules = current_rules()
+    tk.Label(scrollable_frame, text="Priority", font=("Arial", 12, "bold")).grid(row=0, column=2, padx=5, pady=5, sticky="w")
+    for row_index, (category, keywords) in enumerate(rules["categories"].items(), start=1):
         tk.Label(scrollable_frame, text=f"{category}:", font=("Arial", 12)).grid(row=row_index, column=0, padx=5, pady=5, sticky="w")
         text_widget = tk.Text(scrollable_frame, width=50, height=1, font=("Arial", 12), wrap="word")
         text_widget.insert("1.0", ", ".join(keywords))
         text_widget.grid(row=row_index, column=1, padx=5, pady=5, sticky="w")
-        category_entries[category] = text_widget
+        priority_entry = tk.Entry(scrollable_frame, width=5, font=("Arial", 12))
+        priority_entry.insert(0, str(rules["options"][category]["priority"]))
+        priority_entry.grid(row=row_index, column=2, padx=5, pady=5, sticky="w")
+        category_entries[category] = (text_widget, priority_entry)
 
     # Add save button
     tk.Button(category_window, text="Save Changes", command=lambda: save_categories(category_entries), width=15, height=2).pack(pady=10)
 
 def save_categories(category_entries):
-    """Save updated categories to categories.py."""
-    updated_categories = {category: text_widget.get("1.0", "end-1c").split(",") for category, text_widget in category_entries.items()}
-    with open("categories.py", "w", encoding="utf-8") as f:
-        f.write("categories = {\n")
-        for category, keywords in updated_categories.items():
-            f.write(f'    "{category}": {keywords},\n')
-        f.write("}\n")
-    messagebox.showinfo("Success", "Categories updated successfully!")
+    """
+    Save updated categories to the rules file.
+
+    The amount and date conditions of the categories are kept, they are edited in categories.json.
+    """
+    rules = current_rules()
+    try:
+        priorities = {category: int(priority_entry.get() or 0) for category, (_, priority_entry) in category_entries.items()}
+    except ValueError as e:
+        messagebox.showerror("Error", f"Invalid priority: {e}")
+        return
+    updated_categories = {
+        category: [keyword.strip() for keyword in text_widget.get("1.0", "end-1c").split(",")]
+        for category, (text_widget, _) in category_entries.items()
+    }
+    options = {category: {**rules["options"].get(category, {}), "priority": priorities[category]}
+               for category in updated_categories}
+    save_rules(updated_categories, options)
+
+    # Drop the cached matches that the edited categories can affect
+    invalidated = invalidate_cache_file(cache_file, updated_categories)
+    messagebox.showinfo("Success", f"Categories updated successfully!\n{invalidated} cached descriptions will be recategorized.")
 
 def open_uncategorized_manager():
     """Open the Uncategorized Manager window."""
+    # Load the uncategorized entries from the ledger
+    if not os.path.exists(ledger_file):
+        messagebox.showerror("Error", "ledger.sqlite not found. Please run the program first.")
+        return
+
+    # The entries are grouped by merchant from the mapped results, or in SQL, most frequent first
+    connection = open_ledger(ledger_file)
+    try:
+        groups = result_uncategorized(results_folder)
+        if groups is None:
+            groups = query_uncategorized(connection)
+        # Suggestions from the merchants corrected earlier, all scored in one batch
+        suggestions = suggest_categories(connection, groups["merchant"])
+    finally:
+        connection.close()
+
+    if groups.empty:
+        messagebox.showinfo("No Uncategorized Entries", "All entries are categorized!")
+        return
+
+    merchants = list(groups["merchant"])
+    descriptions = list(groups["description"])
+    counts = list(groups["count"])
+    suggested_categories = list(suggestions["category"])
+    confidences = list(suggestions["confidence"])
+    category_names = list(load_categories().keys())
+
+    # Category chosen for each merchant
+    assignments = {}
+
     # Create a new window
     uncategorized_window = tk.Toplevel(root)
     uncategorized_window.title("Uncategorized Manager")
-    uncategorized_window.geometry("800x600")
+    uncategorized_window.geometry("900x600")
 
     # Add a label
     label = tk.Label(uncategorized_window, text="Manage Uncategorized Entries", font=("Arial", 18))
     label.pack(pady=10)
+    tk.Label(uncategorized_window, text=f"{sum(counts)} entries from {len(merchants)} different merchants",
+             font=("Arial", 12)).pack()
 
-    # Create a scrollable frame for the uncategorized entries
-    scrollable_frame = tk.Frame(uncategorized_window)
-    scrollable_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-    canvas = tk.Canvas(scrollable_frame)
-    scrollbar = tk.Scrollbar(scrollable_frame, orient="vertical", command=canvas.yview)
-    scrollable_content = tk.Frame(canvas)
-
-    # Configure the canvas and scrollbar
-    scrollable_content.bind(
-        "<Configure>",
-        lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-    )
-    canvas.create_window((0, 0), window=scrollable_content, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
+    # Only one page of descriptions is put in the Treeview at a time
+    table_frame = tk.Frame(uncategorized_window)
+    table_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-    canvas.pack(side="left", fill="both", expand=True)
+    tree = ttk.Treeview(table_frame, columns=("Forklaring", "Count", "Suggestion", "Category"), show="headings")
+    tree.heading("Forklaring", text="Forklaring")
+    tree.heading("Count", text="Count")
+    tree.heading("Suggestion", text="Suggestion")
+    tree.heading("Category", text="Category")
+    tree.column("Forklaring", width=300)
+    tree.column("Count", width=60, anchor="e")
+    tree.column("Suggestion", width=200)
+    tree.column("Category", width=150)
+    scrollbar = tk.Scrollbar(table_frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
 
-    # Load uncategorized entries from combined_output.csv
-    combined_output_file = os.path.join(output_folder, "combined_output.csv")
-    if not os.path.exists(combined_output_file):
-        messagebox.showerror("Error", "combined_output.csv not found. Please run the program first.")
-        return
-
-    df = pd.read_csv(combined_output_file)
-    uncategorized_df = df[df["Category"] == "Uncategorized"]
-
-    if uncategorized_df.empty:
-        messagebox.showinfo("No Uncategorized Entries", "All entries are categorized!")
-        uncategorized_window.destroy()
-        return
-
-    # Load categories from categories.py
-    from categories import categories
-    category_names = list(categories.keys())
-
-    # Dictionary to store dropdown selections
-    dropdown_selections = {}
-
-    # Display uncategorized entries with dropdowns
-    for row_index, (_, row) in enumerate(uncategorized_df.iterrows()):
-        # Display the entry description
-        description_label = tk.Label(scrollable_content, text=row["Forklaring"], font=("Arial", 12))
-        description_label.grid(row=row_index, column=0, padx=5, pady=5, sticky="w")
-
-        # Create a dropdown menu for categories
-        selected_category = tk.StringVar(scrollable_content)
-        selected_category.set("Select Category")  # Default value
-        dropdown = tk.OptionMenu(scrollable_content, selected_category, *category_names)
-        dropdown.grid(row=row_index, column=1, padx=5, pady=5, sticky="w")
-
-        # Store the dropdown selection
-        dropdown_selections[row_index] = (row, selected_category)
-
-    # Save changes to combined_output.csv
+    page_size = 200
+    page_count = (len(descriptions) + page_size - 1) // page_size
+    current_page = [0]
+    page_label = tk.Label(uncategorized_window, font=("Arial", 10))
+
+    def show_page(page):
+        current_page[0] = min(max(page, 0), page_count - 1)
+        tree.delete(*tree.get_children())
+        start = current_page[0] * page_size
+        for index in range(start, min(start + page_size, len(descriptions))):
+            suggestion = f"{suggested_categories[index]} ({confidences[index]:.0%})" if suggested_categories[index] else ""
+            tree.insert("", tk.END, iid=str(index),
+                        values=(descriptions[index], counts[index], suggestion, assignments.get(merchants[index], "")))
+        page_label.config(text=f"Page {current_page[0] + 1} of {page_count}")
+
+    def assign_category():
+        new_category = selected_category.get()
+        if new_category not in category_names:
+            messagebox.showerror("Error", "Select a category first.")
+            return
+        for item in tree.selection():
+            assignments[merchants[int(item)]] = new_category
+            tree.set(item, "Category", new_category)
+
+    def use_suggestions():
+        for item in tree.selection():
+            suggestion = suggested_categories[int(item)]
+            if suggestion in category_names:
+                assignments[merchants[int(item)]] = suggestion
+                tree.set(item, "Category", suggestion)
+
+    # Controls for paging and assigning the selected descriptions
+    control_frame = tk.Frame(uncategorized_window)
+    control_frame.pack(pady=5)
+    tk.Button(control_frame, text="Previous", command=lambda: show_page(current_page[0] - 1), width=10).pack(side=tk.LEFT, padx=5)
+    page_label.pack(in_=control_frame, side=tk.LEFT, padx=5)
+    tk.Button(control_frame, text="Next", command=lambda: show_page(current_page[0] + 1), width=10).pack(side=tk.LEFT, padx=5)
+
+    selected_category = tk.StringVar(value="Select Category")
+    ttk.Combobox(control_frame, textvariable=selected_category, values=category_names, state="readonly", width=25).pack(side=tk.LEFT, padx=5)
+    tk.Button(control_frame, text="Assign", command=assign_category, width=10).pack(side=tk.LEFT, padx=5)
+    tk.Button(control_frame, text="Use suggestion", command=use_suggestions, width=14).pack(side=tk.LEFT, padx=5)
+
+    # Save the changes to the ledger
     def save_changes():
-        for row_index, (row, selected_category) in dropdown_selections.items():
-            new_category = selected_category.get()
-            if new_category != "Select Category":
-                df.loc[df.index == row.name, "Category"] = new_category
-
-        # Save the updated DataFrame back to combined_output.csv
-        df.to_csv(combined_output_file, index=False)
-        messagebox.showinfo("Success", "Uncategorized entries updated successfully!")
+        updated = 0
+        learned = 0
+        if assignments:
+            # One UPDATE per merchant, all in one transaction
+            connection = open_ledger(ledger_file)
+            try:
+                updated = recategorize_merchants(connection, assignments, only_category="Uncategorized")
+                # The corrections are examples for the merchants that are still uncategorized
+                learned = apply_learned_categories(connection)
+                # Windows opened later map the new version
+                publish_results(connection, results_folder)
+            except sqlite3.OperationalError as e:
+                # The window stays open so the assignments can be saved again after the run
+                messagebox.showerror("Error", f"Failed to save the changes, the ledger is busy: {e}")
+                return
+            finally:
+                connection.close()
+        messagebox.showinfo("Success", f"{updated} uncategorized entries updated successfully!\n"
+                                       f"{learned} more entries categorized like the corrected merchants.")
         uncategorized_window.destroy()
 
     # Add a save button
     save_button = tk.Button(uncategorized_window, text="Save Changes", command=save_changes, width=15, height=2)
     save_button.pack(pady=10)
 
-# Create the main application window
-root = tk.Tk()
-root.title("Finance Master GUI")
-root.geometry("500x830")  # Set the window size
-
-# Add a label
-label = tk.Label(root, text="Welcome to FinanceMaster", font=("Calibri", 24))
-sublabel = tk.Label(root, text="Made by Alexander Wiese", font=("Calibri", 14))
-label.pack(pady=20)
-sublabel.pack(pady=5)
-
-# Create a frame for the input and output lists
-list_frame = tk.Frame(root)
-list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
-
-# Input file list
-input_label = tk.Label(list_frame, text="Input Files:", font=("Arial", 12))
-input_label.grid(row=0, column=0, sticky="w")
-input_listbox = tk.Listbox(list_frame, width=50, height=15)
-input_listbox.grid(row=1, column=0, padx=5, pady=5)
-input_listbox.bind("<Double-Button-1>", lambda event: open_file_from_listbox(input_listbox, input_folder))
-
-# Output file list
-output_label = tk.Label(list_frame, text="Output Files:", font=("Arial", 12))
-output_label.grid(row=2, column=0, sticky="w")
-output_listbox = tk.Listbox(list_frame, width=50, height=15)
-output_listbox.grid(row=3, column=0, padx=5, pady=5)
-output_listbox.bind("<Double-Button-1>", lambda event: open_file_from_listbox(output_listbox, output_folder))
-
-# Create a frame for the buttons
-button_frame = tk.Frame(list_frame)
-button_frame.grid(row=1, column=3, rowspan=3, padx=10, pady=5, sticky="n")
-
-# Add buttons to the button frame
-upload_button = tk.Button(button_frame, text="Upload Files", command=upload_files, width=15, height=2)
-upload_button.pack(pady=10)
-
-refresh_button = tk.Button(button_frame, text="Refresh", command=update_file_lists, width=15, height=2)
-refresh_button.pack(pady=10)
-
-run_button = tk.Button(button_frame, text="Run program", command=run_program, width=15, height=2)
-run_button.pack(pady=10)
-
-# Add the Budget Creator button
-budget_button = tk.Button(button_frame, text="Budget Creator", command=open_budget_creator, width=15, height=2, state=tk.DISABLED)
-budget_button.pack(pady=10)
-
-# Add the "Add Category" button
-add_category_button = tk.Button(button_frame, text="Add Category", command=open_category_manager, width=15, height=2)
-add_category_button.pack(pady=10)
-
-# Add a progress bar
-progress_bar = ttk.Progressbar(root, mode="indeterminate", length=400)
-progress_bar.pack(pady=20)
- 
-# Initialize file lists
-update_file_lists()
-
-# Run the application
-root.mainloop()
\ No newline at end of file
+    show_page(0)
+
+def main():
+    """Build the main window, start the pipeline worker and run the Tk loop."""
+    # The widgets are used by the callbacks above
+    global root, input_listbox, output_listbox, budget_button, profile_var, watch_var, progress_bar, status_label
+
+    # Create the main application window
+    root = tk.Tk()
+    root.title("Finance Master GUI")
+    root.geometry("500x900")  # Set the window size
+
+    # Add a label
+    label = tk.Label(root, text="Welcome to FinanceMaster", font=("Calibri", 24))
+    sublabel = tk.Label(root, text="Made by Alexander Wiese", font=("Calibri", 14))
+    label.pack(pady=20)
+    sublabel.pack(pady=5)
+
+    # Create a frame for the input and output lists
+    list_frame = tk.Frame(root)
+    list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+    # Input file list
+    input_label = tk.Label(list_frame, text="Input Files:", font=("Arial", 12))
+    input_label.grid(row=0, column=0, sticky="w")
+    input_listbox = tk.Listbox(list_frame, width=50, height=15)
+    input_listbox.grid(row=1, column=0, padx=5, pady=5)
+    input_listbox.bind("<Double-Button-1>", lambda event: open_file_from_listbox(input_listbox, input_folder))
+
+    # Output file list
+    output_label = tk.Label(list_frame, text="Output Files:", font=("Arial", 12))
+    output_label.grid(row=2, column=0, sticky="w")
+    output_listbox = tk.Listbox(list_frame, width=50, height=15)
+    output_listbox.grid(row=3, column=0, padx=5, pady=5)
+    output_listbox.bind("<Double-Button-1>", lambda event: open_file_from_listbox(output_listbox, output_folder))
+
+    # Create a frame for the buttons
+    button_frame = tk.Frame(list_frame)
+    button_frame.grid(row=1, column=3, rowspan=3, padx=10, pady=5, sticky="n")
+
+    # Add buttons to the button frame
+    upload_button = tk.Button(button_frame, text="Upload Files", command=upload_files, width=15, height=2)
+    upload_button.pack(pady=10)
+
+    refresh_button = tk.Button(button_frame, text="Refresh", command=update_file_lists, width=15, height=2)
+    refresh_button.pack(pady=10)
+
+    run_button = tk.Button(button_frame, text="Run program", command=run_program, width=15, height=2)
+    run_button.pack(pady=10)
+
+    cancel_button = tk.Button(button_frame, text="Cancel run", command=cancel_program, width=15, height=2)
+    cancel_button.pack(pady=10)
+
+    # Opt-in profiling of the next run, it makes the run slower
+    profile_var = tk.IntVar(value=0)
+    profile_check = tk.Checkbutton(button_frame, text="Profile run", variable=profile_var)
+    profile_check.pack()
+
+    report_button = tk.Button(button_frame, text="Run report", command=open_run_report, width=15, height=2)
+    report_button.pack(pady=10)
+
+    # Opt-in processing of statements as they appear in InputFolder
+    watch_var = tk.IntVar(value=watch_input_folder)
+    watch_check = tk.Checkbutton(button_frame, text="Watch InputFolder", variable=watch_var)
+    watch_check.pack()
+
+    # Add the Budget Creator button
+    budget_button = tk.Button(button_frame, text="Budget Creator", command=open_budget_creator, width=15, height=2, state=tk.DISABLED)
+    budget_button.pack(pady=10)
+
+    # Add the "Add Category" button
+    add_category_button = tk.Button(button_frame, text="Add Category", command=open_category_manager, width=15, height=2)
+    add_category_button.pack(pady=10)
+
+    # Add the "Uncategorized" button
+    uncategorized_button = tk.Button(button_frame, text="Uncategorized", command=open_uncategorized_manager, width=15, height=2)
+    uncategorized_button.pack(pady=10)
+
+    # Add a progress bar
+    progress_bar = ttk.Progressbar(root, mode="determinate", length=400)
+    progress_bar.pack(pady=(20, 5))
+    status_label = tk.Label(root, text="", font=("Arial", 10))
+    status_label.pack()
+
+    # Initialize file lists
+    update_file_lists()
+
+    # Start the pipeline worker and poll its events from the Tk loop
+    threading.Thread(target=pipeline_worker, daemon=True).start()
+    poll_pipeline_events()
+    poll_input_folder()
+
+    # Run the application
+    root.mainloop()
+
+# Pool workers that import this module must not open a window
+if __name__ == "__main__":
+    main()
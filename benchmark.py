@@ -0,0 +1,127 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime
+import pandas as pd
+import CleanDataKontoutskrift as pipeline
+from category_rules import current_rules
+from generate_statements import generate_statement, write_statement
+
+# Stages that can be benchmarked
+benchmark_stages = ["read_statement", "categorize_entries", "find_similar_names", "create_budget_excel"]
+
+def git_commit():
+    """Return the current git commit of the repository, or None."""
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def time_call(function, repeat):
+    """Return the best wall time in seconds of calling function repeat times."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run_benchmarks(sizes, stages=benchmark_stages, merchants=200, noise=0.3, repeat=1, seed=0):
+    """
+    Time the pipeline stages on generated statements of each size.
+
+    Each stage works on a fresh copy of the input it needs, without the
+    description cache, so the results measure the algorithms themselves.
+    Returns a list of result dictionaries.
+    """
+    rules = current_rules()
+    categories = rules["categories"]
+    results = []
+
+    with tempfile.TemporaryDirectory() as work_folder:
+        for rows in sizes:
+            statement_file = os.path.join(work_folder, f"statement_{rows}.xlsx")
+            statement = generate_statement(rows, merchants, noise=noise, seed=seed)
+            write_statement(statement, statement_file)
+            del statement
+
+            cleaned = pipeline.read_statement(statement_file)
+            categorized = pipeline.categorize_entries(cleaned.copy(), pipeline.column_forklaring, categories, rules=rules)
+
+            stage_functions = {
+                "read_statement": lambda: pipeline.read_statement(statement_file),
+                "categorize_entries": lambda: pipeline.categorize_entries(cleaned.copy(), pipeline.column_forklaring, categories, rules=rules),
+                "find_similar_names": lambda: pipeline.find_similar_names(categorized.copy(), pipeline.column_forklaring),
+                "create_budget_excel": lambda: pipeline.create_budget_excel(os.path.join(work_folder, "Totals.xlsx"), categorized.copy()),
+            }
+
+            for stage in stages:
+                seconds = time_call(stage_functions[stage], repeat)
+                results.append({
+                    "stage": stage,
+                    "rows": rows,
+                    "unique_descriptions": int(cleaned[pipeline.column_forklaring].nunique()),
+                    "seconds": round(seconds, 6),
+                    "rows_per_second": round(rows / seconds) if seconds else None,
+                })
+                print(f"{stage:<22} {rows:>9} rows {seconds:10.3f} s")
+
+    return results
+
+def compare_results(current, previous):
+    """Print the change in time of each stage and size against a previous benchmark run."""
+    previous_times = {(result["stage"], result["rows"]): result["seconds"] for result in previous["results"]}
+    print(f"Compared with {previous.get('commit') or 'unknown commit'} from {previous.get('created')}:")
+    for result in current["results"]:
+        before = previous_times.get((result["stage"], result["rows"]))
+        if before:
+            print(f"{result['stage']:<22} {result['rows']:>9} rows {before:10.3f} s -> {result['seconds']:10.3f} s "
+                  f"({before / result['seconds']:.2f}x)")
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark the statement cleaning pipeline on generated data.")
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="comma separated row counts")
+    parser.add_argument("--stages", default=",".join(benchmark_stages), help="comma separated stages to run")
+    parser.add_argument("--merchants", type=int, default=200, help="number of different merchants")
+    parser.add_argument("--noise", type=float, default=0.3, help="probability of noise in each description")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the best time is kept")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", help="earlier results JSON file to compare with")
+    args = parser.parse_args(argv)
+
+    stages = args.stages.split(",")
+    unknown = [stage for stage in stages if stage not in benchmark_stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+
+    report = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "merchants": args.merchants,
+        "noise": args.noise,
+        "results": run_benchmarks([int(size) for size in args.sizes.split(",")], stages,
+                                  args.merchants, args.noise, args.repeat),
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare_results(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+import math
+import pandas as pd
+from columnar_store import column_category, amount_scale
+
+def current_month():
+    """Return the current month as "YYYY-MM"."""
+    return str(pd.Timestamp.now().to_period("M"))
+
+def parse_month(value):
+    """Return a month typed in the Budget Creator as "YYYY-MM". Raises ValueError if it is not a month."""
+    month = pd.Period(value.strip(), freq="M")
+    # Blank text and "nan" parse as a missing period
+    if pd.isna(month):
+        raise ValueError(f"{value!r} is not a month")
+    return str(month)
+
+def parse_amount(value):
+    """
+    Return an amount typed in the Budget Creator in øre, or None if it is blank.
+
+    Spaces are ignored and a decimal comma is accepted, "1 500,50" is 150050.
+    Raises ValueError for anything else, also for "inf", "nan" and amounts too large to store.
+    """
+    value = value.replace(" ", "").replace("\u00a0", "").replace(",", ".")
+    if not value:
+        return None
+    amount = float(value)
+    # The ledger stores øre in a 64-bit integer
+    if not math.isfinite(amount) or abs(amount * amount_scale) >= 2 ** 63:
+        raise ValueError(f"{value!r} is not an amount")
+    return round(amount * amount_scale)
+
+def save_budgets(connection, month, amounts):
+    """
+    Store the budget of every category for a month, in one transaction.
+
+    amounts maps categories to amounts in øre. A category with None has its
+    budget for the month removed.
+    """
+    with connection:
+        connection.executemany(
+            "INSERT INTO budgets (month, category, amount) VALUES (?, ?, ?) "
+            "ON CONFLICT (month, category) DO UPDATE SET amount = excluded.amount",
+            [(month, category, amount) for category, amount in amounts.items() if amount is not None],
+        )
+        connection.executemany(
+            "DELETE FROM budgets WHERE month = ? AND category = ?",
+            [(month, category) for category, amount in amounts.items() if amount is None],
+        )
+
+def query_budgets(connection, month):
+    """Return the budget of every category for a month in kroner, as a dictionary."""
+    return {
+        category: amount / amount_scale
+        for category, amount in connection.execute(
+            "SELECT category, amount FROM budgets WHERE month = ?", (month,))
+    }
+
+def query_budget_months(connection):
+    """Return the months with a budget or transactions, newest first."""
+    return [row[0] for row in connection.execute(
+        "SELECT month FROM budgets UNION SELECT month FROM monthly_totals WHERE month IS NOT NULL "
+        "ORDER BY month DESC"
+    )]
+
+def query_budget_variance(connection, month=None):
+    """
+    Return the budget, actual spending and variance in kroner per month and category.
+
+    The budgets are joined in one vectorized merge with the cached monthly
+    totals, which the ledger keeps up to date for the months of newly loaded
+    statements only. Actual spending is "Ut fra konto", and a positive variance
+    is money left in the budget. Categories with spending but no budget are
+    included with a budget of 0. With month set, only that month is returned.
+    """
+    condition, parameters = ("WHERE month = ?", (month,)) if month is not None else ("WHERE month IS NOT NULL", ())
+    budgets = pd.read_sql_query(
+        f"SELECT month, category, amount FROM budgets {condition}", connection, params=parameters)
+    actuals = pd.read_sql_query(
+        f"SELECT month, category, ut_sum FROM monthly_totals {condition}", connection, params=parameters)
+
+    variance = budgets.merge(actuals, on=["month", "category"], how="outer")
+    variance[["amount", "ut_sum"]] = variance[["amount", "ut_sum"]].fillna(0)
+    variance = pd.DataFrame({
+        "Month": variance["month"],
+        column_category: variance["category"],
+        "Budget": variance["amount"] / amount_scale,
+        "Actual": variance["ut_sum"] / amount_scale,
+        "Variance": (variance["amount"] - variance["ut_sum"]) / amount_scale,
+    })
+    return variance.sort_values(["Month", column_category], ignore_index=True)
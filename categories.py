@@ -1,3 +1,5 @@
+# Seed for categories.json, which holds the category rules and is edited in the Category Manager.
+# This file is only read when categories.json is missing, edits here do not change an existing categories.json.
 categories = {
     "Mat og spiselige ting": ['Rema', 'Kiwi', 'coop', 'oda', 'mat', 'food', 'foodora', 'mcd', 'restaurant', 'cafe', 'dining', 'wolt', 'Kebab', 'Pizza', 'Burger', 'Sushi', 'Thai', 'Taco', ''],
     "Entertainment": ['movie', 'cinema', 'concert', 'entertainment'],
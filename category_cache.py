@@ -0,0 +1,143 @@
+import os
+import re
+import json
+import hashlib
+from collections import OrderedDict
+
+# Maximum number of descriptions kept in the cache
+max_cache_entries = 100000
+
+def normalize_description(description):
+    """Return the cache key for a description."""
+    return description.strip()
+
+def categories_hash(categories):
+    """Return a content hash of the categories dictionary."""
+    content = json.dumps(categories, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def load_cache(cache_file, categories, max_entries=max_cache_entries):
+    """
+    Load the description cache from disk.
+
+    If the stored categories hash differs from the current categories, only
+    the entries affected by the changed categories are invalidated.
+    """
+    cache = {
+        "categories_hash": categories_hash(categories),
+        "rules": {category: list(keywords) for category, keywords in categories.items()},
+        "entries": OrderedDict(),
+        "max_entries": max_entries,
+        "hits": 0,
+        "misses": 0,
+    }
+
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable cache {cache_file}: {e}")
+            return cache
+
+        cache["entries"] = OrderedDict(stored.get("entries", {}))
+        if stored.get("categories_hash") != cache["categories_hash"]:
+            invalidated = invalidate_entries(cache["entries"], stored.get("rules", {}), categories)
+            print(f"Categories changed, invalidated {invalidated} cached descriptions")
+
+    return cache
+
+def refresh_cache(cache, categories):
+    """
+    Bring a cache kept in memory between runs up to date with the current categories.
+    """
+    new_hash = categories_hash(categories)
+    if cache["categories_hash"] != new_hash:
+        invalidated = invalidate_entries(cache["entries"], cache["rules"], categories)
+        print(f"Categories changed, invalidated {invalidated} cached descriptions")
+        cache["categories_hash"] = new_hash
+        cache["rules"] = {category: list(keywords) for category, keywords in categories.items()}
+    cache["hits"] = 0
+    cache["misses"] = 0
+    return cache
+
+def save_cache(cache, cache_file):
+    """Write the description cache to disk and print the hit/miss counters."""
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    stored = {
+        "categories_hash": cache["categories_hash"],
+        "rules": cache["rules"],
+        "entries": cache["entries"],
+    }
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(stored, f, ensure_ascii=False)
+    print(f"Description cache: {len(cache['entries'])} entries, "
+          f"{cache['hits']} hits, {cache['misses']} misses")
+
+def get_entry(cache, description, field):
+    """Return a cached field ("keywords" or "canonical") for a description, or None."""
+    key = normalize_description(description)
+    entry = cache["entries"].get(key)
+    if entry is None or field not in entry:
+        cache["misses"] += 1
+        return None
+
+    cache["hits"] += 1
+    cache["entries"].move_to_end(key)
+    return entry[field]
+
+def put_entry(cache, description, field, value):
+    """Store a field for a description, evicting the least recently used entries."""
+    key = normalize_description(description)
+    entries = cache["entries"]
+    entries.setdefault(key, {})[field] = value
+    entries.move_to_end(key)
+    while len(entries) > cache["max_entries"]:
+        entries.popitem(last=False)
+
+def invalidate_entries(entries, old_categories, new_categories):
+    """
+    Drop the cached category matches that a change of categories can affect.
+
+    An entry is affected when it matched a category whose keywords changed or
+    that was removed, or when the new keywords of a changed category match it.
+    Canonical names do not depend on categories and are kept.
+    """
+    changed = [
+        category for category in set(old_categories) | set(new_categories)
+        if list(old_categories.get(category, [])) != list(new_categories.get(category, []))
+    ]
+    if not changed:
+        return 0
+
+    patterns = [
+        re.compile(r'\b(?:' + '|'.join(re.escape(keyword) for keyword in new_categories[category]) + r')\b', re.IGNORECASE)
+        for category in changed if new_categories.get(category)
+    ]
+
+    invalidated = 0
+    for key, entry in entries.items():
+        if "keywords" not in entry:
+            continue
+        matched = {category for category, keyword in entry["keywords"]}
+        if any(category in matched for category in changed) or any(pattern.search(key) for pattern in patterns):
+            del entry["keywords"]
+            invalidated += 1
+
+    return invalidated
+
+def invalidate_cache_file(cache_file, new_categories):
+    """Invalidate the entries of a stored cache affected by new categories."""
+    if not os.path.exists(cache_file):
+        return 0
+
+    with open(cache_file, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+
+    invalidated = invalidate_entries(stored.get("entries", {}), stored.get("rules", {}), new_categories)
+    stored["categories_hash"] = categories_hash(new_categories)
+    stored["rules"] = {category: list(keywords) for category, keywords in new_categories.items()}
+
+    with open(cache_file, "w", encoding="utf-8") as f:
+        json.dump(stored, f, ensure_ascii=False)
+    return invalidated
@@ -0,0 +1,238 @@
+import os
+import re
+import json
+import pickle
+import numpy as np
+import pandas as pd
+from columnar_store import amount_scale
+from category_cache import categories_hash
+
+# Categories and their rules, edited in the Category Manager and kept in the repository
+base_folder = os.path.dirname(os.path.abspath(__file__))
+rules_file = os.path.join(base_folder, "categories.json")
+
+# Optional settings of a category rule and their defaults. Amounts are in kroner and compared
+# with the amount of the transaction in either direction, dates are ISO dates and inclusive.
+rule_options = {"priority": 0, "min_amount": None, "max_amount": None, "from_date": None, "to_date": None}
+
+# Rules loaded by this process for each rules file, with the stat of the file they were read from
+loaded_rules = {}
+
+# Layout of the compiled rules, an index in another layout is compiled again
+rules_index_format = 2
+
+# Function to compile the category keywords into a single matcher
+def build_category_matcher(categories):
+    """
+    Compile the category keywords into a lookup structure for match_keywords.
+
+    Keywords that are a single word go into a word -> keywords hash. Phrases
+    and keywords with punctuation are indexed by their first word and verified
+    with a whole-word regex. The empty keyword matches any description that
+    contains at least one word character, exactly like the old per-category regex.
+    Every entry keeps its category and keyword, so the hits of each keyword can be counted.
+    """
+    matcher = {
+        "categories": list(categories.keys()),
+        "words": {},
+        "phrases": {},
+        "always": [],
+        "any_word": [],
+    }
+
+    for category_index, keywords in enumerate(categories.values()):
+        for keyword in dict.fromkeys(keywords):
+            keyword_words = re.findall(r"\w+", keyword.lower())
+            if not keyword:
+                matcher["any_word"].append((category_index, keyword))
+            elif re.fullmatch(r"\w+", keyword):
+                matcher["words"].setdefault(keyword.lower(), []).append((category_index, keyword))
+            else:
+                pattern = re.compile(r"\b" + re.escape(keyword) + r"\b", re.IGNORECASE)
+                if keyword_words:
+                    matcher["phrases"].setdefault(keyword_words[0], []).append((pattern, category_index, keyword))
+                else:
+                    matcher["always"].append((pattern, category_index, keyword))
+
+    return matcher
+
+def match_keywords(matcher, description):
+    """
+    Return every [category, keyword] pair matching a description, in category order.
+    """
+    if not isinstance(description, str):
+        return []
+
+    words = set(re.findall(r"\w+", description.lower()))
+    matched = set(matcher["any_word"]) if words else set()
+
+    for word in words:
+        matched.update(matcher["words"].get(word, ()))
+        for pattern, category_index, keyword in matcher["phrases"].get(word, ()):
+            if pattern.search(description):
+                matched.add((category_index, keyword))
+
+    for pattern, category_index, keyword in matcher["always"]:
+        if pattern.search(description):
+            matched.add((category_index, keyword))
+
+    return [[matcher["categories"][category_index], keyword] for category_index, keyword in sorted(matched)]
+
+def make_rules(categories, options=None):
+    """
+    Compile categories and their rule options into the rules used by categorize_entries.
+
+    categories maps category names to keywords, options maps category names to
+    the settings in rule_options. The rules hold the keyword matcher, the
+    ranking of the categories and their conditions, and a version that changes
+    whenever any of them does.
+    """
+    categories = {category: list(keywords) for category, keywords in categories.items()}
+    options = {
+        category: {**rule_options, **(options or {}).get(category, {})}
+        for category in categories
+    }
+    # A higher priority wins, between equal priorities the category defined last
+    names = list(categories)
+    ranking = sorted(range(len(names)), key=lambda index: (options[names[index]]["priority"], index))
+    rank = np.empty(len(categories), dtype=np.int64)
+    rank[ranking] = np.arange(len(categories))
+    conditional = [
+        index for index, category in enumerate(categories)
+        if any(options[category][name] is not None for name in ("min_amount", "max_amount", "from_date", "to_date"))
+    ]
+    return {
+        "format": rules_index_format,
+        "version": rules_version(categories, options),
+        "categories": categories,
+        "options": options,
+        "rank": rank,
+        "conditional": conditional,
+        "matcher": build_category_matcher(categories),
+    }
+
+def to_rule_list(categories, options):
+    """Return the categories and the options that differ from the defaults as the list stored in the rules file."""
+    rules = []
+    for category, keywords in categories.items():
+        rule = {"category": category, "keywords": list(keywords)}
+        rule.update({
+            name: value for name, value in options.get(category, {}).items()
+            if name in rule_options and value != rule_options[name]
+        })
+        rules.append(rule)
+    return rules
+
+def rules_version(categories, options):
+    """Return the version of categories and their options, a content hash."""
+    return categories_hash(to_rule_list(categories, options))
+
+def read_rules_file(path):
+    """Return the categories and options stored in a rules file."""
+    with open(path, "r", encoding="utf-8") as f:
+        stored = json.load(f)
+    categories = {}
+    options = {}
+    for rule in stored["rules"]:
+        categories[rule["category"]] = list(rule["keywords"])
+        options[rule["category"]] = {name: rule[name] for name in rule_options if name in rule}
+    return categories, options
+
+def save_rules(categories, options=None, path=None):
+    """
+    Write categories and their options to the rules file, together with its compiled index.
+
+    Both files are replaced atomically, so a run reading them at the same time
+    sees either the old or the new rules. Returns the new rules.
+    """
+    if path is None:
+        path = rules_file
+    rules = make_rules(categories, options)
+    stored = {"rules": to_rule_list(rules["categories"], rules["options"])}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(stored, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+    save_rules_index(rules, path)
+    return rules
+
+def index_file(path):
+    """Return the file the compiled index of a rules file is kept in."""
+    return os.path.splitext(path)[0] + ".index.pkl"
+
+def save_rules_index(rules, path):
+    """Serialize compiled rules next to their rules file."""
+    with open(index_file(path) + ".tmp", "wb") as f:
+        pickle.dump(rules, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(index_file(path) + ".tmp", index_file(path))
+
+def load_rules(path=None):
+    """
+    Return the rules in a rules file, from its compiled index when that has the same version.
+
+    Without a rules file one is created from the categories in categories.py,
+    which is only a seed. categories.json is the source of truth.
+    """
+    if path is None:
+        path = rules_file
+    if not os.path.exists(path):
+        from categories import categories as default_categories  # The rules the project started with
+        save_rules(default_categories, path=path)
+        print(f"Created {path} from categories.py")
+
+    categories, options = read_rules_file(path)
+    version = rules_version(categories, options)
+    try:
+        with open(index_file(path), "rb") as f:
+            rules = pickle.load(f)
+        if rules.get("format") == rules_index_format and rules.get("version") == version:
+            return rules
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    rules = make_rules(categories, options)
+    save_rules_index(rules, path)
+    return rules
+
+def current_rules(path=None):
+    """
+    Return the current rules, reloaded only when the rules file changed since this process last read it.
+
+    Unchanged rules are returned as the same object, so callers can keep
+    anything derived from them until the version changes.
+    """
+    if path is None:
+        path = rules_file
+    try:
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        stamp = None
+
+    loaded = loaded_rules.get(path)
+    if loaded is not None and stamp is not None and loaded[0] == stamp:
+        return loaded[1]
+
+    rules = load_rules(path)
+    if loaded is not None and loaded[1]["version"] == rules["version"]:
+        rules = loaded[1]
+    stat = os.stat(path)
+    loaded_rules[path] = ((stat.st_mtime_ns, stat.st_size), rules)
+    return rules
+
+def condition_mask(options, amounts, dates):
+    """
+    Return a mask of the rows that meet the amount and date conditions of a rule.
+
+    amounts are the amounts of the rows in øre, dates a Series of their dates.
+    Rows without a date do not meet a date condition.
+    """
+    mask = np.ones(len(amounts), dtype=bool)
+    if options["min_amount"] is not None:
+        mask &= amounts >= round(options["min_amount"] * amount_scale)
+    if options["max_amount"] is not None:
+        mask &= amounts <= round(options["max_amount"] * amount_scale)
+    if options["from_date"] is not None:
+        mask &= (dates >= pd.Timestamp(options["from_date"])).to_numpy(dtype=bool)
+    if options["to_date"] is not None:
+        mask &= (dates < pd.Timestamp(options["to_date"]) + pd.Timedelta(days=1)).to_numpy(dtype=bool)
+    return mask
@@ -0,0 +1,126 @@
+import zlib
+import numpy as np
+import pandas as pd
+from ledger import refresh_partials, merchant_source_files
+from merchant_names import merchant_key_strings
+
+# Character n-grams of the merchant names are hashed into vectors of this size
+ngram_size = 3
+ngram_dimension = 4096
+
+# Lowest cosine similarity to a corrected merchant for its category to be used
+suggestion_threshold = 0.75
+
+# Merchants scored per matrix product, bounds the memory of a batch
+suggestion_block_size = 2048
+
+def ngram_vectors(texts):
+    """
+    Return an L2-normalized matrix of hashed character n-gram counts, one row per text.
+    """
+    # Each distinct n-gram is hashed once, the counts are made with one bincount over flat indexes
+    gram_columns = {}
+    indexes = []
+    for row, text in enumerate(texts):
+        padded = f" {text} "
+        offset = row * ngram_dimension
+        for start in range(max(len(padded) - ngram_size + 1, 1)):
+            gram = padded[start:start + ngram_size]
+            column = gram_columns.get(gram)
+            if column is None:
+                column = gram_columns[gram] = zlib.crc32(gram.encode("utf-8")) % ngram_dimension
+            indexes.append(offset + column)
+
+    counts = np.bincount(np.array(indexes, dtype=np.int64), minlength=len(texts) * ngram_dimension)
+    vectors = counts.astype(np.float32).reshape(len(texts), ngram_dimension)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def nearest_categories(example_texts, example_categories, texts, block_size=suggestion_block_size):
+    """
+    Return the category of the most similar example for every text and its cosine similarity.
+
+    The texts are scored against all examples with one matrix product per
+    block of block_size texts.
+    """
+    example_categories = np.asarray(example_categories, dtype=object)
+    categories = np.empty(len(texts), dtype=object)
+    similarities = np.zeros(len(texts), dtype=np.float32)
+    if len(texts) == 0 or len(example_texts) == 0:
+        return categories, similarities
+
+    example_vectors = ngram_vectors(example_texts)
+    for start in range(0, len(texts), block_size):
+        scores = ngram_vectors(texts[start:start + block_size]) @ example_vectors.T
+        best = scores.argmax(axis=1)
+        categories[start:start + block_size] = example_categories[best]
+        similarities[start:start + block_size] = scores[np.arange(len(best)), best]
+    return categories, similarities
+
+def load_examples(connection):
+    """
+    Return the merchants categorized by hand in the ledger and their category.
+
+    A merchant corrected to several categories gets the one used for most rows.
+    """
+    examples = pd.read_sql_query(
+        "SELECT merchant, category, COUNT(*) AS count FROM transactions WHERE manual = 1 "
+        "GROUP BY merchant, category",
+        connection,
+    )
+    examples = examples.sort_values("count", ascending=False).drop_duplicates("merchant")
+    return examples[["merchant", "category"]].reset_index(drop=True)
+
+def suggest_categories(connection, merchants):
+    """
+    Return a frame with the suggested category and its confidence for each merchant.
+
+    The merchants and the examples are compared by their merchant keys, so card
+    suffixes, dates, references and payment prefixes do not count.
+    """
+    examples = load_examples(connection)
+    example_keys = merchant_key_strings(examples["merchant"].astype(object))
+    keys = merchant_key_strings(pd.Series(list(merchants), dtype=object))
+    categories, similarities = nearest_categories(list(example_keys), examples["category"], list(keys))
+    return pd.DataFrame({"merchant": list(merchants), "category": categories, "confidence": similarities})
+
+def apply_learned_categories(connection, threshold=suggestion_threshold):
+    """
+    Categorize the uncategorized merchants of the ledger like their nearest corrected merchant.
+
+    Only suggestions with a confidence of at least threshold are used. The rows
+    are marked as learned, so they are scored again after the next correction
+    and fall back to their rules when their statement is loaded again.
+    Returns the number of rows changed.
+    """
+    merchants = [row[0] for row in connection.execute(
+        "SELECT DISTINCT merchant FROM transactions "
+        "WHERE manual != 1 AND (category = 'Uncategorized' OR manual = 2) AND merchant IS NOT NULL"
+    )]
+    suggestions = suggest_categories(connection, merchants)
+    if suggestions.empty:
+        return 0
+
+    confident = suggestions["confidence"] >= threshold
+    learned = [
+        (category, merchant, category)
+        for merchant, category in zip(suggestions.loc[confident, "merchant"], suggestions.loc[confident, "category"])
+    ]
+    unlearned = [(merchant,) for merchant in suggestions.loc[~confident, "merchant"]]
+
+    # One UPDATE per merchant, all in one transaction
+    with connection:
+        before = connection.total_changes
+        connection.executemany(
+            "UPDATE transactions SET category = ?, manual = 2 WHERE merchant = ? AND manual != 1 "
+            "AND (category = 'Uncategorized' OR manual = 2) AND category != ?",
+            learned,
+        )
+        connection.executemany(
+            "UPDATE transactions SET category = 'Uncategorized', manual = 0 WHERE merchant = ? AND manual = 2",
+            unlearned,
+        )
+        changed = connection.total_changes - before
+        if changed:
+            refresh_partials(connection, merchant_source_files(connection, suggestions["merchant"]))
+        return changed
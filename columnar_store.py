@@ -0,0 +1,119 @@
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # The columnar store is optional, the CSV output is always written
+    pa = None
+    pq = None
+
+# Column names
+column_kontonummer = "Kontonummer"
+column_dato = "Dato"
+column_forklaring = "Forklaring"
+column_rentedato = "Rentedato"
+column_ut_fra_konto = "Ut fra konto"
+column_inn_pa_konto = "Inn på konto"
+column_category = "Category"
+
+date_columns = [column_dato, column_rentedato]
+amount_columns = [column_ut_fra_konto, column_inn_pa_konto]
+text_columns = [column_forklaring, column_category]
+
+# Amounts are kept as integer øre, in memory and in the store
+amount_scale = 100
+
+# Version of the in-memory schema, cached artifacts written with another version are rebuilt
+schema_version = 3
+
+def parse_dates(values):
+    """
+    Parse a column of dates given as datetimes, ISO strings or day-first strings like 31.01.2024.
+
+    Each distinct value is parsed once and mapped back to the rows.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+
+    unique_values = pd.Series(values.dropna().unique())
+    if unique_values.empty:
+        return pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+
+    # ISO dates first, a day-first parse would swap their day and month
+    parsed = pd.to_datetime(unique_values, format="ISO8601", errors="coerce")
+    missing = parsed.isna()
+    if missing.any():
+        parsed[missing] = pd.to_datetime(unique_values[missing], format="mixed", dayfirst=True, errors="coerce")
+    return values.map(pd.Series(parsed.values, index=unique_values))
+
+def apply_schema(df):
+    """
+    Convert a cleaned statement to the compact in-memory schema.
+
+    Dates are parsed to datetimes, amounts given in kroner become integer øre
+    and the repeated text columns become categoricals. Sums of øre are exact,
+    so the totals do not drift the way float kroner do. The account number
+    becomes text, whether the export stored it as a number or as text.
+    """
+    for column in date_columns:
+        if column in df.columns:
+            df[column] = parse_dates(df[column])
+    for column in amount_columns:
+        if column in df.columns:
+            df[column] = (pd.to_numeric(df[column], errors="coerce").fillna(0) * amount_scale).round().astype("int64")
+    for column in text_columns:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    if column_kontonummer in df.columns:
+        df[column_kontonummer] = df[column_kontonummer].astype(str).str.strip().astype("category")
+    return df
+
+def to_output_frame(df):
+    """Return a copy of a frame in the in-memory schema with the amounts in kroner, for the CSV output."""
+    df = df.copy()
+    for column in amount_columns:
+        if column in df.columns:
+            df[column] = df[column] / amount_scale
+    return df
+
+def store_available():
+    """Return True if pyarrow is installed and the columnar store can be used."""
+    return pa is not None
+
+def store_schema():
+    """Return the Arrow schema of the columnar store."""
+    return pa.schema([
+        (column_dato, pa.timestamp("ms")),
+        (column_forklaring, pa.string()),
+        (column_rentedato, pa.timestamp("ms")),
+        (column_ut_fra_konto, pa.int64()),
+        (column_inn_pa_konto, pa.int64()),
+        (column_category, pa.string()),
+    ])
+
+def to_store_table(df):
+    """
+    Convert a categorized frame in the in-memory schema to an Arrow table with the store schema.
+    """
+    columns = {}
+    for column in date_columns:
+        values = df[column] if column in df.columns else pd.Series(pd.NaT, index=df.index)
+        columns[column] = parse_dates(values).astype("datetime64[ms]")
+    for column in amount_columns:
+        columns[column] = df[column] if column in df.columns else pd.Series(0, index=df.index, dtype="int64")
+    columns[column_forklaring] = df[column_forklaring].astype("string")
+    columns[column_category] = df[column_category].astype("string")
+
+    frame = pd.DataFrame(columns, index=df.index)
+    return pa.Table.from_pandas(frame, schema=store_schema(), preserve_index=False)
+
+def open_store_writer(store_file):
+    """Open a Parquet writer for the columnar store, or return None if pyarrow is missing."""
+    if not store_available():
+        return None
+    return pq.ParquetWriter(store_file, store_schema(), use_dictionary=text_columns, compression="snappy")
+
+def write_store_chunk(writer, df):
+    """Append a categorized frame to an open store writer."""
+    if writer is not None:
+        writer.write_table(to_store_table(df))
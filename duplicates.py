@@ -0,0 +1,46 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from columnar_store import (
+    column_kontonummer, column_dato, column_forklaring, column_rentedato, column_ut_fra_konto, column_inn_pa_konto,
+)
+from ledger import folded_descriptions
+
+fingerprint_columns = [column_kontonummer, column_dato, column_rentedato, column_ut_fra_konto, column_inn_pa_konto]
+
+def row_fingerprints(df, occurrences):
+    """
+    Return a 64-bit fingerprint of every row of a cleaned statement chunk.
+
+    The fingerprint covers the account, Dato, Rentedato, the amounts, the
+    normalized Forklaring and the occurrence of the same transaction earlier in
+    the statement. Two identical purchases on one day therefore get different
+    fingerprints, and so do identical purchases on two accounts, while the same
+    purchase in an overlapping export of the same account gets the same one.
+    occurrences counts the transactions seen in earlier chunks of the statement
+    and is updated.
+    """
+    transaction = df.reindex(columns=fingerprint_columns)
+    transaction["key"] = folded_descriptions(df[column_forklaring])
+    base = pd.Series(pd.util.hash_pandas_object(transaction, index=False).values, index=df.index)
+
+    earlier = base.map(occurrences).fillna(0).astype("int64")
+    occurrence = base.groupby(base).cumcount() + earlier
+    for value, count in base.value_counts().items():
+        occurrences[value] = occurrences.get(value, 0) + count
+
+    fingerprint = pd.DataFrame({"base": base.values, "occurrence": occurrence.values})
+    return pd.Series(pd.util.hash_pandas_object(fingerprint, index=False).values, index=df.index)
+
+def find_duplicates(fingerprints, seen):
+    """
+    Return a mask of the rows whose fingerprint is in the seen hash set, then add all fingerprints to it.
+    """
+    is_duplicate = np.fromiter((fingerprint in seen for fingerprint in fingerprints.tolist()),
+                               dtype=bool, count=len(fingerprints))
+    seen.update(fingerprints.tolist())
+    return pd.Series(is_duplicate, index=fingerprints.index)
+
+def statements_key(previous_key, filename, file_hash):
+    """Return a key for the statements read so far, chained from the key of the statements before."""
+    return hashlib.sha256(f"{previous_key}\0{filename}\0{file_hash}".encode("utf-8")).hexdigest()
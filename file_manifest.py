@@ -0,0 +1,87 @@
+import os
+import json
+import pickle
+import hashlib
+
+def file_hash(file_path):
+    """Return the SHA-256 hash of a file's content."""
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def load_manifest(manifest_file):
+    """Load the manifest of processed input files."""
+    if os.path.exists(manifest_file):
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable manifest {manifest_file}: {e}")
+    return {"files": {}}
+
+def save_manifest(manifest, manifest_file):
+    """Write the manifest of processed input files."""
+    os.makedirs(os.path.dirname(manifest_file), exist_ok=True)
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+def get_unchanged_entry(manifest, filename, file_path):
+    """
+    Return the manifest entry for a file if it has not changed, otherwise None.
+
+    Size and modification time are checked first. The content hash is only
+    computed when they differ, so a file that was merely touched or copied
+    again is still recognized as unchanged.
+    """
+    entry = manifest["files"].get(filename)
+    stat = os.stat(file_path)
+    if entry is None or entry["size"] != stat.st_size:
+        return None
+    if entry["mtime"] == stat.st_mtime:
+        return entry
+
+    if file_hash(file_path) != entry["hash"]:
+        return None
+    entry["mtime"] = stat.st_mtime
+    return entry
+
+def record_file(manifest, filename, file_path, artifacts):
+    """Record a processed file and the paths of its artifacts."""
+    stat = os.stat(file_path)
+    entry = manifest["files"].get(filename, {})
+    entry.update({
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "hash": file_hash(file_path),
+    })
+    entry.update(artifacts)
+    manifest["files"][filename] = entry
+    return entry
+
+def remove_missing_files(manifest, filenames, artifact_folder):
+    """Drop manifest entries, and their artifacts, for files that no longer exist."""
+    removed = [filename for filename in manifest["files"] if filename not in filenames]
+    for filename in removed:
+        entry = manifest["files"].pop(filename)
+        for key in ("cleaned", "categorized", "periods", "fingerprints"):
+            artifact = os.path.join(artifact_folder, entry.get(key, ""))
+            if entry.get(key) and os.path.exists(artifact):
+                os.remove(artifact)
+        print(f"Removed deleted input file from output: {filename}")
+    return removed
+
+def append_frame(artifact_path, df):
+    """Append a frame to an artifact holding a stream of pickled frames."""
+    with open(artifact_path, "ab") as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+def read_frames(artifact_path):
+    """Yield the frames of an artifact written with append_frame, one at a time."""
+    with open(artifact_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
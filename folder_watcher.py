@@ -0,0 +1,58 @@
+import os
+import time
+
+def snapshot_folder(folder, suffix=None):
+    """Return the size and modification time of every file in a folder, keyed by filename."""
+    snapshot = {}
+    try:
+        entries = os.scandir(folder)
+    except FileNotFoundError:
+        return snapshot
+    with entries:
+        for entry in entries:
+            if entry.is_file() and (suffix is None or entry.name.endswith(suffix)):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    return snapshot
+
+def diff_snapshots(old, new):
+    """Return the added, removed and changed filenames between two snapshots, sorted."""
+    added = sorted(name for name in new if name not in old)
+    removed = sorted(name for name in old if name not in new)
+    changed = sorted(name for name in new if name in old and new[name] != old[name])
+    return added, removed, changed
+
+def start_watch(folder, suffix=".xlsx"):
+    """Start watching a folder, the files already in it count as seen."""
+    return {
+        "folder": folder,
+        "suffix": suffix,
+        "snapshot": snapshot_folder(folder, suffix),
+        "pending": set(),
+        "last_change": None,
+    }
+
+def poll_watch(watch, settle_seconds, now=None):
+    """
+    Compare the folder with the last snapshot and debounce the changes.
+
+    A burst of copied files, or a large file still being written, keeps
+    changing the snapshot. The changed files are only returned as ready once
+    the folder has not changed for settle_seconds. Returns the added, removed
+    and changed files of this poll and the files ready to be processed.
+    """
+    if now is None:
+        now = time.monotonic()
+
+    snapshot = snapshot_folder(watch["folder"], watch["suffix"])
+    added, removed, changed = diff_snapshots(watch["snapshot"], snapshot)
+    watch["snapshot"] = snapshot
+    if added or removed or changed:
+        watch["pending"].update(added, removed, changed)
+        watch["last_change"] = now
+
+    ready = []
+    if watch["pending"] and now - watch["last_change"] >= settle_seconds:
+        ready = sorted(watch["pending"])
+        watch["pending"].clear()
+    return {"added": added, "removed": removed, "changed": changed, "ready": ready}
@@ -0,0 +1,118 @@
+import os
+import csv
+import random
+import argparse
+from datetime import date, timedelta
+import openpyxl
+
+# Columns of a bank export, the first column is dropped by the pipeline
+statement_columns = ["Kontonummer", "Dato", "Forklaring", "Rentedato", "Ut fra konto", "Inn på konto"]
+
+# Merchants seen on Norwegian card statements
+merchant_names = [
+    "KIWI", "REMA 1000", "COOP EXTRA", "COOP PRIX", "COOP MEGA", "MENY", "JOKER", "BUNNPRIS", "SPAR",
+    "NARVESEN", "7-ELEVEN", "CIRCLE K", "SHELL", "ESSO", "ST1", "UNO-X", "VY", "RUTER", "FLYTOGET",
+    "APOTEK 1", "VITUSAPOTEK", "FARMASIET", "ELKJØP", "POWER", "CLAS OHLSON", "BILTEMA", "JULA", "XXL",
+    "H&M", "CUBUS", "DRESSMANN", "VINMONOPOLET", "PEPPES PIZZA", "DOLLY DIMPLES", "BURGER KING",
+    "MCD", "SUSHI BAR", "THAI ORCHID", "FOODORA", "WOLT", "NETFLIX.COM", "SPOTIFY", "HBO MAX", "VIAPLAY",
+    "DISNEY+", "TELENOR", "TELIA", "TALKMORE", "VIPPS", "NOROFF", "STEAM", "PLAYSTATION", "NINTENDO",
+    "OPENAI CHATGPT", "NORSK TIPPING", "GJENSIDIGE", "FRENDE", "TRYG", "LÅNEKASSEN", "HUSLEIE",
+]
+income_names = ["LØNN", "NAV", "OVERFØRING", "KONTOREGULERING", "AVRUNDET SPARING"]
+city_names = [
+    "OSLO", "BERGEN", "TRONDHEIM", "STAVANGER", "TROMSØ", "DRAMMEN", "FREDRIKSTAD", "KRISTIANSAND",
+    "SANDVIKA", "LILLESTRØM", "BODØ", "ÅLESUND", "HAMAR", "MOSS",
+]
+
+def build_merchants(merchant_count, rng):
+    """Return merchant_count merchant names, adding store numbers once the base names run out."""
+    merchants = []
+    for index in range(merchant_count):
+        name = merchant_names[index % len(merchant_names)]
+        if index >= len(merchant_names):
+            name = f"{name} {rng.randint(100, 999)}"
+        merchants.append((name, rng.choice(city_names)))
+    return merchants
+
+def noisy_description(merchant, city, day, rng, noise):
+    """Return a description for a merchant with the noise seen in real exports."""
+    description = merchant
+    if rng.random() < 0.7:
+        description += f" {city}"
+    if rng.random() < noise:
+        description += f" *{rng.randint(1000, 9999)}"
+    if rng.random() < noise:
+        description += f" {day.day:02d}.{day.month:02d}"
+    if rng.random() < noise / 3:
+        description = f"VISA {description}"
+    if rng.random() < noise / 3:
+        description += f" REF {rng.randint(100000, 999999)}"
+    if rng.random() < noise / 4:
+        description = description.title()
+    return description
+
+def generate_statement(rows, merchant_count=200, start=date(2024, 1, 1), days=365, noise=0.3, seed=0):
+    """
+    Return a list of statement rows with realistic descriptions and amounts.
+
+    noise is the probability of card suffixes, dates and other noise being
+    added to a description.
+    """
+    rng = random.Random(seed)
+    merchants = build_merchants(merchant_count, rng)
+    # Merchants are visited with a skewed frequency, like real spending
+    weights = [1 / (rank + 1) for rank in range(len(merchants))]
+    visits = rng.choices(merchants, weights, k=rows)
+    account = f"{rng.randint(1000, 9999)}.{rng.randint(10, 99)}.{rng.randint(10000, 99999)}"
+
+    statement = []
+    for day_offset, (merchant, city) in zip(sorted(rng.randrange(days) for _ in range(rows)), visits):
+        day = start + timedelta(days=day_offset)
+        interest_day = day + timedelta(days=rng.choice((0, 0, 1, 2)))
+        if rng.random() < 0.9:
+            description = noisy_description(merchant, city, day, rng, noise)
+            amount_out, amount_in = round(rng.lognormvariate(5, 1), 2), None
+        else:
+            description = rng.choice(income_names)
+            amount_out, amount_in = None, round(rng.lognormvariate(8, 1), 2)
+        statement.append([account, day, description, interest_day, amount_out, amount_in])
+    return statement
+
+def write_statement(statement, output_file):
+    """Write statement rows to an .xlsx or .csv file, depending on the extension."""
+    if output_file.endswith(".csv"):
+        with open(output_file, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(statement_columns)
+            writer.writerows(statement)
+        return
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Kontoutskrift")
+    sheet.append(statement_columns)
+    for row in statement:
+        sheet.append(row)
+    workbook.save(output_file)
+
+def main(argv=None):
+    """Command line entry point."""
+    parser = argparse.ArgumentParser(description="Generate synthetic bank statements for testing and benchmarks.")
+    parser.add_argument("--rows", type=int, default=1000, help="rows per statement")
+    parser.add_argument("--merchants", type=int, default=200, help="number of different merchants")
+    parser.add_argument("--files", type=int, default=1, help="number of statements, one month apart")
+    parser.add_argument("--noise", type=float, default=0.3, help="probability of noise in each description")
+    parser.add_argument("--format", choices=("xlsx", "csv"), default="xlsx", help="file format")
+    parser.add_argument("--output-folder", default="InputFolder", help="folder for the statements")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_folder, exist_ok=True)
+    for file_index in range(args.files):
+        month_start = date(2024 + file_index // 12, file_index % 12 + 1, 1)
+        statement = generate_statement(args.rows, args.merchants, month_start, 28, args.noise, args.seed + file_index)
+        output_file = os.path.join(args.output_folder, f"statement_{month_start:%Y_%m}.{args.format}")
+        write_statement(statement, output_file)
+        print(f"Generated {args.rows} rows: {output_file}")
+
+if __name__ == "__main__":
+    main()
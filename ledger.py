@@ -0,0 +1,383 @@
+import os
+import time
+import sqlite3
+import pandas as pd
+from columnar_store import (
+    column_dato, column_forklaring, column_rentedato, column_ut_fra_konto, column_inn_pa_konto, column_category,
+    amount_scale, parse_dates,
+)
+
+# Rows read from the ledger at a time when writing the combined outputs
+ledger_read_size = 100000
+
+# Seconds a connection waits for another one to finish writing, a statement is loaded in one transaction
+ledger_timeout = 60
+
+# Transactions of every statement, amounts in øre and dates as ISO text
+ledger_schema = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    source_file TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    dato TEXT,
+    rentedato TEXT,
+    forklaring TEXT,
+    merchant TEXT,
+    ut_fra_konto INTEGER NOT NULL DEFAULT 0,
+    inn_pa_konto INTEGER NOT NULL DEFAULT 0,
+    category TEXT NOT NULL,
+    manual INTEGER NOT NULL DEFAULT 0,
+    batch INTEGER NOT NULL,
+    UNIQUE (source_file, row_number)
+);
+CREATE INDEX IF NOT EXISTS transactions_dato ON transactions (dato);
+CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category);
+CREATE INDEX IF NOT EXISTS transactions_merchant ON transactions (merchant);
+
+-- Partial aggregates of each statement per month and category, merged for the totals.
+-- The minimum and maximum skip missing amounts, they are NULL when a column has none.
+CREATE TABLE IF NOT EXISTS partials (
+    source_file TEXT NOT NULL,
+    month TEXT,
+    category TEXT NOT NULL,
+    ut_sum INTEGER NOT NULL,
+    inn_sum INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    ut_min INTEGER,
+    ut_max INTEGER,
+    inn_min INTEGER,
+    inn_max INTEGER
+);
+CREATE INDEX IF NOT EXISTS partials_source_file ON partials (source_file);
+
+-- Partials merged per month and category, refreshed only for the months whose partials change
+CREATE TABLE IF NOT EXISTS monthly_totals (
+    month TEXT,
+    category TEXT NOT NULL,
+    ut_sum INTEGER NOT NULL,
+    inn_sum INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS monthly_totals_month ON monthly_totals (month);
+
+-- Budget per month and category in øre, entered in the Budget Creator
+CREATE TABLE IF NOT EXISTS budgets (
+    month TEXT NOT NULL,
+    category TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    PRIMARY KEY (month, category)
+);
+"""
+
+# A category set by hand (manual 1) is kept as long as the row still belongs to the same merchant.
+# IS compares a missing merchant as a value, so a row that lost its description is never NULL.
+# A learned category (manual 2) falls back to the category of the rules.
+upsert_statement = """
+INSERT INTO transactions (source_file, row_number, dato, rentedato, forklaring, merchant,
+                          ut_fra_konto, inn_pa_konto, category, batch)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (source_file, row_number) DO UPDATE SET
+    dato = excluded.dato,
+    rentedato = excluded.rentedato,
+    forklaring = excluded.forklaring,
+    ut_fra_konto = excluded.ut_fra_konto,
+    inn_pa_konto = excluded.inn_pa_konto,
+    category = CASE WHEN manual = 1 AND merchant IS excluded.merchant THEN category ELSE excluded.category END,
+    manual = manual = 1 AND merchant IS excluded.merchant,
+    merchant = excluded.merchant,
+    batch = excluded.batch
+"""
+
+def open_ledger(ledger_file):
+    """Open the ledger database, creating the table and indexes if needed."""
+    folder = os.path.dirname(ledger_file)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    connection = sqlite3.connect(ledger_file, timeout=ledger_timeout)
+    # In WAL mode the windows can read the ledger while a run writes to it
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.executescript(ledger_schema)
+
+    # Partials from before missing amounts were skipped in the minimum and maximum are built again
+    if connection.execute("SELECT \"notnull\" FROM pragma_table_info('partials') WHERE name = 'ut_min'").fetchone()[0]:
+        connection.execute("DROP TABLE partials")
+        connection.executescript(ledger_schema)
+
+    # A ledger written before the partial aggregates or monthly totals existed gets them once
+    def is_empty(table):
+        return not connection.execute(f"SELECT EXISTS (SELECT 1 FROM {table})").fetchone()[0]
+
+    if not is_empty("transactions") and is_empty("partials"):
+        with connection:
+            refresh_partials(connection, [row[0] for row in connection.execute(
+                "SELECT DISTINCT source_file FROM transactions")])
+    elif not is_empty("partials") and is_empty("monthly_totals"):
+        with connection:
+            refresh_monthly_totals(connection, [row[0] for row in connection.execute(
+                "SELECT DISTINCT month FROM partials")])
+    return connection
+
+def folded_descriptions(descriptions):
+    """
+    Return every description case folded with single spaces, as stored in the merchant column.
+
+    Unlike merchant_names.merchant_key_strings, card suffixes, dates and
+    references are kept. Each distinct description is folded once.
+    """
+    unique_descriptions = pd.Series(descriptions.dropna().unique())
+    keys = unique_descriptions.astype(str).str.casefold().str.split().str.join(" ")
+    return descriptions.map(pd.Series(keys.values, index=unique_descriptions.values)).astype(object)
+
+def to_ledger_rows(source_file, df, first_row, batch):
+    """Return the ledger rows of a categorized frame, numbered from first_row in the statement."""
+    def text(values):
+        return values.astype(object).where(values.notna(), None)
+
+    def iso_dates(column):
+        if column not in df.columns:
+            return [None] * len(df)
+        return text(df[column].dt.strftime("%Y-%m-%d"))
+
+    def amounts(column):
+        return df[column].tolist() if column in df.columns else [0] * len(df)
+
+    return list(zip(
+        [source_file] * len(df),
+        (first_row + df.index).tolist(),
+        iso_dates(column_dato),
+        iso_dates(column_rentedato),
+        text(df[column_forklaring]),
+        folded_descriptions(df[column_forklaring]),
+        amounts(column_ut_fra_konto),
+        amounts(column_inn_pa_konto),
+        df[column_category].astype(str),
+        [batch] * len(df),
+    ))
+
+def new_batch():
+    """Return a batch number that marks the rows written while loading a statement."""
+    return time.time_ns()
+
+def upsert_transactions(connection, source_file, df, first_row, batch):
+    """
+    Insert or update the rows of a categorized frame with one executemany.
+
+    Loading the same statement again updates its rows in place. The caller
+    commits once the whole statement is written.
+    """
+    connection.executemany(upsert_statement, to_ledger_rows(source_file, df, first_row, batch))
+
+def finish_statement(connection, source_file, batch):
+    """
+    Remove the rows of a statement that were not written in this batch, aggregate it and commit.
+
+    That drops rows of a statement that became shorter and rows that are now
+    filtered out.
+    """
+    connection.execute("DELETE FROM transactions WHERE source_file = ? AND batch != ?", (source_file, batch))
+    refresh_partials(connection, [source_file])
+    connection.commit()
+
+def remove_statements(connection, source_files):
+    """Delete the rows and partial aggregates of statements that no longer exist, in one transaction."""
+    with connection:
+        months = partial_months(connection, source_files)
+        connection.executemany("DELETE FROM transactions WHERE source_file = ?", [(name,) for name in source_files])
+        connection.executemany("DELETE FROM partials WHERE source_file = ?", [(name,) for name in source_files])
+        refresh_monthly_totals(connection, months)
+
+def refresh_partials(connection, source_files):
+    """
+    Recompute the partial aggregates of statements from their rows.
+
+    Each statement is one shard: its sums, count, minimum and maximum per month
+    and category only change when its own rows do. A missing amount is stored
+    as 0, so it is left out of the minimum and maximum. The monthly totals of the
+    months the statements had or now have are refreshed with them. The caller
+    commits.
+    """
+    months = partial_months(connection, source_files)
+    for source_file in source_files:
+        connection.execute("DELETE FROM partials WHERE source_file = ?", (source_file,))
+        connection.execute(
+            "INSERT INTO partials SELECT source_file, substr(dato, 1, 7), category, "
+            "SUM(ut_fra_konto), SUM(inn_pa_konto), COUNT(*), "
+            "MIN(NULLIF(ut_fra_konto, 0)), MAX(NULLIF(ut_fra_konto, 0)), "
+            "MIN(NULLIF(inn_pa_konto, 0)), MAX(NULLIF(inn_pa_konto, 0)) "
+            "FROM transactions WHERE source_file = ? GROUP BY substr(dato, 1, 7), category",
+            (source_file,),
+        )
+    refresh_monthly_totals(connection, months | partial_months(connection, source_files))
+
+def partial_months(connection, source_files):
+    """Return the months, None for rows without a date, in the partial aggregates of statements."""
+    months = set()
+    for source_file in source_files:
+        months.update(row[0] for row in connection.execute(
+            "SELECT DISTINCT month FROM partials WHERE source_file = ?", (source_file,)))
+    return months
+
+def refresh_monthly_totals(connection, months):
+    """Merge the partial aggregates of the given months again into the monthly totals. The caller commits."""
+    for month in months:
+        connection.execute("DELETE FROM monthly_totals WHERE month IS ?", (month,))
+        connection.execute(
+            "INSERT INTO monthly_totals SELECT month, category, SUM(ut_sum), SUM(inn_sum), SUM(count) "
+            "FROM partials WHERE month IS ? GROUP BY category",
+            (month,),
+        )
+
+def merchant_source_files(connection, merchants):
+    """Return the statements with rows of any of the merchants."""
+    merchants = list(merchants)
+    source_files = set()
+    # Bounded by the number of parameters SQLite accepts in one statement
+    for start in range(0, len(merchants), 500):
+        block = merchants[start:start + 500]
+        source_files.update(row[0] for row in connection.execute(
+            f"SELECT DISTINCT source_file FROM transactions WHERE merchant IN ({', '.join('?' * len(block))})",
+            block,
+        ))
+    return sorted(source_files)
+
+def recategorize_merchants(connection, assignments, only_category=None):
+    """
+    Set the category of every transaction of each merchant, one UPDATE per merchant in one transaction.
+
+    assignments maps merchant keys to categories. With only_category set, only
+    rows in that category are changed, e.g. "Uncategorized". The rows are
+    marked as set by hand, so the next load of their statement keeps them.
+    Returns the number of rows changed.
+    """
+    statement = "UPDATE transactions SET category = ?, manual = 1 WHERE merchant = ?"
+    parameters = [(category, merchant) for merchant, category in assignments.items()]
+    if only_category is not None:
+        statement += " AND category = ?"
+        parameters = [parameter + (only_category,) for parameter in parameters]
+
+    with connection:
+        before = connection.total_changes
+        connection.executemany(statement, parameters)
+        changed = connection.total_changes - before
+        refresh_partials(connection, merchant_source_files(connection, assignments))
+        return changed
+
+def query_uncategorized(connection, category="Uncategorized"):
+    """Return the merchants of a category with an example description and their count, most frequent first."""
+    return pd.read_sql_query(
+        "SELECT merchant, MIN(forklaring) AS description, COUNT(*) AS count FROM transactions "
+        "WHERE category = ? GROUP BY merchant ORDER BY count DESC, merchant",
+        connection, params=(category,),
+    )
+
+def query_category_totals(connection, source_file=None):
+    """
+    Return the totals per category in kroner, in the layout of Totals.xlsx with a Total row.
+
+    The totals are merged from the partial aggregates, of one statement when source_file is set.
+    """
+    condition, parameters = ("WHERE source_file = ? ", (source_file,)) if source_file is not None else ("", ())
+    totals = pd.read_sql_query(
+        f"SELECT category, SUM(ut_sum) AS ut, SUM(inn_sum) AS inn FROM partials {condition}"
+        "GROUP BY category ORDER BY category",
+        connection, params=parameters,
+    )
+    totals = pd.DataFrame({
+        column_category: totals["category"],
+        column_ut_fra_konto: totals["ut"] / amount_scale,
+        column_inn_pa_konto: totals["inn"] / amount_scale,
+    })
+    total_row = pd.DataFrame([["Total", totals[column_ut_fra_konto].sum(), totals[column_inn_pa_konto].sum()]],
+                             columns=totals.columns)
+    return pd.concat([totals, total_row], ignore_index=True)
+
+def read_transaction_frames(connection, chunk_size=None):
+    """
+    Yield the transactions of every statement in filename and row order, as frames in the in-memory schema.
+
+    The rows carry their current category, including the categories set by hand
+    and learned from them.
+    """
+    if chunk_size is None:
+        chunk_size = ledger_read_size
+    for rows in pd.read_sql_query(
+        "SELECT dato, forklaring, rentedato, ut_fra_konto, inn_pa_konto, category "
+        "FROM transactions ORDER BY source_file, row_number",
+        connection, chunksize=chunk_size,
+    ):
+        yield pd.DataFrame({
+            column_dato: parse_dates(rows["dato"]),
+            column_forklaring: rows["forklaring"].astype("category"),
+            column_rentedato: parse_dates(rows["rentedato"]),
+            column_ut_fra_konto: rows["ut_fra_konto"],
+            column_inn_pa_konto: rows["inn_pa_konto"],
+            column_category: rows["category"].astype("category"),
+        })
+
+def query_period_totals(connection):
+    """
+    Return the sums in øre and the count per month and category, in the layout of the period aggregates.
+
+    The totals are read from the monthly totals merged from the partial aggregates of the statements.
+    """
+    totals = pd.read_sql_query(
+        "SELECT month, category, ut_sum AS ut, inn_sum AS inn, count FROM monthly_totals",
+        connection,
+    )
+    return pd.DataFrame({
+        "Month": pd.PeriodIndex(totals["month"], freq="M"),
+        column_category: totals["category"],
+        column_ut_fra_konto: totals["ut"],
+        column_inn_pa_konto: totals["inn"],
+        "Count": totals["count"],
+    })
+
+def query_account_totals(connection, source_file=None):
+    """
+    Return the totals per statement and category in kroner, merged from the partial aggregates.
+
+    Besides the sums there are the count and the smallest and largest single
+    amount, NaN when a column has no amounts. With source_file set, only that statement is returned.
+    """
+    condition, parameters = ("WHERE source_file = ? ", (source_file,)) if source_file is not None else ("", ())
+    totals = pd.read_sql_query(
+        "SELECT source_file, category, SUM(ut_sum) AS ut, SUM(inn_sum) AS inn, SUM(count) AS count, "
+        "MIN(ut_min) AS ut_min, MAX(ut_max) AS ut_max, MIN(inn_min) AS inn_min, MAX(inn_max) AS inn_max "
+        f"FROM partials {condition}GROUP BY source_file, category ORDER BY source_file, category",
+        connection, params=parameters,
+    )
+    return pd.DataFrame({
+        "Account": totals["source_file"],
+        column_category: totals["category"],
+        column_ut_fra_konto: totals["ut"] / amount_scale,
+        column_inn_pa_konto: totals["inn"] / amount_scale,
+        "Count": totals["count"],
+        f"{column_ut_fra_konto} min": totals["ut_min"] / amount_scale,
+        f"{column_ut_fra_konto} max": totals["ut_max"] / amount_scale,
+        f"{column_inn_pa_konto} min": totals["inn_min"] / amount_scale,
+        f"{column_inn_pa_konto} max": totals["inn_max"] / amount_scale,
+    })
+
+def query_accounts(connection):
+    """Return the statements that have partial aggregates, in order."""
+    return [row[0] for row in connection.execute("SELECT DISTINCT source_file FROM partials ORDER BY source_file")]
+
+def load_category_totals(ledger_file, source_file=None):
+    """Return the per-category totals from the ledger, or None if there is no ledger yet."""
+    if not os.path.exists(ledger_file):
+        return None
+    connection = open_ledger(ledger_file)
+    try:
+        return query_category_totals(connection, source_file)
+    finally:
+        connection.close()
+
+def load_accounts(ledger_file):
+    """Return the statements in the ledger, or an empty list if there is no ledger yet."""
+    if not os.path.exists(ledger_file):
+        return []
+    connection = open_ledger(ledger_file)
+    try:
+        return query_accounts(connection)
+    finally:
+        connection.close()
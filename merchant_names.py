@@ -0,0 +1,43 @@
+import pandas as pd
+
+# Noise in bank descriptions that does not identify the merchant, matched after case folding.
+# Plain numbers such as store numbers are kept, category keywords like "1671" rely on them.
+merchant_noise_patterns = [
+    r"\*\d+",                               # Card suffix, "*1234"
+    r"\bref\.?\s*\d+",                      # Reference number, "REF 184903"
+    r"\b\d{1,2}\.\d{1,2}(?:\.\d{2,4})?\b",  # Transaction date, "12.03" or "12.03.24"
+    r"\b\d{6,}\b",                          # Long reference or account numbers
+]
+
+# Payment method prefixes in front of the merchant, "VISA REMA 1000"
+merchant_prefixes = ["visa", "varekjøp", "kortkjøp"]
+
+def merchant_key_strings(names):
+    """
+    Return the merchant key of every name in a Series of unique strings.
+
+    The names are case folded, the noise is removed and the whitespace
+    collapsed, all with vectorized string operations. A name that is only
+    noise keeps its case folded text as key.
+    """
+    folded = names.astype(str).str.casefold()
+    keys = folded
+    for pattern in merchant_noise_patterns:
+        keys = keys.str.replace(pattern, " ", regex=True)
+    if merchant_prefixes:
+        keys = keys.str.replace(r"^\s*(?:" + "|".join(merchant_prefixes) + r")\b", " ", regex=True)
+    keys = keys.str.split().str.join(" ")
+
+    folded = folded.str.split().str.join(" ")
+    return keys.where(keys != "", folded)
+
+def normalize_merchants(descriptions):
+    """
+    Return the merchant key of every description, e.g. "kiwi 505 oslo" for "KIWI 505 OSLO *1234 12.03".
+
+    Each distinct description is normalized once and the keys are broadcast
+    back to the rows as a categorical. Missing descriptions stay missing.
+    """
+    unique_descriptions = pd.Series(descriptions.dropna().unique())
+    keys = merchant_key_strings(unique_descriptions)
+    return descriptions.map(pd.Series(keys.values, index=unique_descriptions.values)).astype("category")
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import pandas as pd
+from columnar_store import (
+    column_dato, column_forklaring, column_rentedato, column_ut_fra_konto, column_inn_pa_konto, column_category,
+    parse_dates,
+)
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+except ImportError:  # Without pyarrow the GUI queries the ledger instead
+    pa = None
+    pc = None
+    ipc = None
+
+# Rows read from the ledger per record batch when publishing
+publish_batch_size = 100000
+
+# Table mapped by this process for each results folder, with its version
+mapped_results = {}
+
+def results_schema():
+    """Return the Arrow schema of the published results."""
+    return pa.schema([
+        (column_dato, pa.timestamp("ms")),
+        (column_forklaring, pa.dictionary(pa.int32(), pa.string())),
+        ("Merchant", pa.dictionary(pa.int32(), pa.string())),
+        (column_rentedato, pa.timestamp("ms")),
+        (column_ut_fra_konto, pa.int64()),
+        (column_inn_pa_konto, pa.int64()),
+        (column_category, pa.dictionary(pa.int32(), pa.string())),
+        ("Manual", pa.int8()),
+    ])
+
+def publish_results(connection, results_folder, version=None):
+    """
+    Write every transaction of the ledger to a new Arrow IPC file and point results.json at it.
+
+    The file is uncompressed so readers can memory-map it without copying.
+    Each version gets its own file, because a file mapped by the GUI cannot be
+    replaced on Windows. Older versions are removed once no one maps them.
+    Returns the version.
+    """
+    if pa is None:
+        return None
+    if version is None:
+        version = time.time_ns()
+
+    os.makedirs(results_folder, exist_ok=True)
+    results_name = f"results_{version}.arrow"
+    schema = results_schema()
+    batches = pd.read_sql_query(
+        "SELECT dato, forklaring, merchant, rentedato, ut_fra_konto, inn_pa_konto, category, manual "
+        "FROM transactions ORDER BY source_file, row_number",
+        connection, chunksize=publish_batch_size,
+    )
+    with ipc.new_file(os.path.join(results_folder, results_name), schema) as writer:
+        for batch in batches:
+            frame = pd.DataFrame({
+                column_dato: parse_dates(batch["dato"]).astype("datetime64[ms]"),
+                column_forklaring: batch["forklaring"],
+                "Merchant": batch["merchant"],
+                column_rentedato: parse_dates(batch["rentedato"]).astype("datetime64[ms]"),
+                column_ut_fra_konto: batch["ut_fra_konto"],
+                column_inn_pa_konto: batch["inn_pa_konto"],
+                column_category: batch["category"],
+                "Manual": batch["manual"].astype("int8"),
+            })
+            writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+
+    # Readers only see the new file once the pointer is replaced
+    pointer_file = os.path.join(results_folder, "results.json")
+    with open(pointer_file + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": version, "file": results_name}, f)
+    os.replace(pointer_file + ".tmp", pointer_file)
+
+    for filename in os.listdir(results_folder):
+        if filename.startswith("results_") and filename.endswith(".arrow") and filename != results_name:
+            try:
+                os.remove(os.path.join(results_folder, filename))
+            except OSError:  # Still mapped by a GUI window
+                pass
+    return version
+
+def results_version(results_folder):
+    """Return the version and file of the published results, or (None, None)."""
+    try:
+        with open(os.path.join(results_folder, "results.json"), "r", encoding="utf-8") as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    return pointer["version"], os.path.join(results_folder, pointer["file"])
+
+def map_results(results_folder):
+    """
+    Return the published results as an Arrow table memory-mapped without copying, or None.
+
+    The mapping is kept and reused until a new version is published, so opening
+    a window again costs no reading or parsing.
+    """
+    if pa is None:
+        return None
+    version, results_file = results_version(results_folder)
+    if version is None:
+        return None
+
+    mapped = mapped_results.get(results_folder)
+    if mapped is not None and mapped[0] == version:
+        return mapped[1]
+
+    try:
+        table = ipc.open_file(pa.memory_map(results_file, "r")).read_all()
+    except (OSError, pa.ArrowInvalid) as e:
+        print(f"Ignoring unreadable results {results_file}: {e}")
+        return None
+    mapped_results[results_folder] = (version, table)
+    return table
+
+def result_uncategorized(results_folder, category="Uncategorized"):
+    """
+    Return the merchants of a category from the mapped results, in the layout of
+    ledger.query_uncategorized, or None.
+    """
+    table = map_results(results_folder)
+    if table is None:
+        return None
+
+    rows = table.filter(pc.equal(table.column(column_category).cast(pa.string()), category))
+    frame = rows.select(["Merchant", column_forklaring]).to_pandas()
+    frame = pd.DataFrame({"merchant": frame["Merchant"].astype(str), "description": frame[column_forklaring].astype(str)})
+    groups = frame.groupby("merchant").agg(description=("description", "min"), count=("description", "size"))
+    groups = groups.reset_index()
+    return groups.sort_values(["count", "merchant"], ascending=[False, True], ignore_index=True)
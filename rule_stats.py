@@ -0,0 +1,140 @@
+import os
+import json
+import numpy as np
+
+# Keywords of this length or shorter match many unrelated descriptions as whole words
+short_keyword_length = 3
+
+# Category pairs listed in the text summary of the rule report
+rule_report_top = 10
+
+def new_rule_stats():
+    """
+    Return empty rule hit statistics.
+
+    The statistics only hold counts, so the statistics of chunks and
+    statements can be added together in any order with merge_rule_stats.
+    """
+    return {"rows": 0, "conflicts": 0, "keywords": {}, "categories": {}, "assigned": {}, "pairs": {}}
+
+def add_rule_hits(stats, categories, key_keywords, key_rows, matches, weights, winners):
+    """
+    Add the hits of one categorized chunk to the statistics.
+
+    key_keywords holds the [category, keyword] pairs matched by every merchant
+    key and key_rows its number of rows. matches is the boolean category matrix
+    that decided the categories, per key or per row, with the rows each of its
+    rows stands for in weights. winners holds the category position of every
+    row, with len(categories) for "Uncategorized".
+    """
+    stats["rows"] += len(winners)
+    for keywords, rows in zip(key_keywords, key_rows.tolist()):
+        if not rows:
+            continue
+        for category, keyword in keywords:
+            category_keywords = stats["keywords"].setdefault(category, {})
+            category_keywords[keyword] = category_keywords.get(keyword, 0) + rows
+
+    # Rows matched by each category and pair of categories, in one matrix product
+    weighted = matches.astype(np.int64) * weights[:, None]
+    pair_rows = matches.T.astype(np.int64) @ weighted
+    stats["conflicts"] += int(weights[matches.sum(axis=1) > 1].sum())
+    for first, second in zip(*np.nonzero(pair_rows)):
+        if first == second:
+            stats["categories"][categories[first]] = stats["categories"].get(categories[first], 0) + int(pair_rows[first, first])
+        elif first < second:
+            pairs = stats["pairs"].setdefault(categories[first], {})
+            pairs[categories[second]] = pairs.get(categories[second], 0) + int(pair_rows[first, second])
+
+    names = list(categories) + ["Uncategorized"]
+    for position, rows in enumerate(np.bincount(winners, minlength=len(names)).tolist()):
+        if rows:
+            stats["assigned"][names[position]] = stats["assigned"].get(names[position], 0) + rows
+    return stats
+
+def merge_rule_stats(total, stats):
+    """Add the statistics stats to total and return total."""
+    total["rows"] += stats["rows"]
+    total["conflicts"] += stats["conflicts"]
+    for field in ("categories", "assigned"):
+        for name, rows in stats[field].items():
+            total[field][name] = total[field].get(name, 0) + rows
+    for field in ("keywords", "pairs"):
+        for name, counts in stats[field].items():
+            merged = total[field].setdefault(name, {})
+            for other, rows in counts.items():
+                merged[other] = merged.get(other, 0) + rows
+    return total
+
+def build_rule_report(stats, categories):
+    """
+    Return a report of how the categories and their keywords matched the statements.
+
+    Besides the hits of every category and keyword it lists the keywords that
+    matched no row, keywords used in several categories, very short keywords,
+    and the category pairs that matched the same rows, most frequent first.
+    """
+    keyword_categories = {}
+    for category, keywords in categories.items():
+        for keyword in keywords:
+            keyword_categories.setdefault(keyword.strip().lower(), []).append(category)
+
+    keyword_hits = []
+    for category, keywords in categories.items():
+        for keyword in dict.fromkeys(keywords):
+            keyword_hits.append({
+                "category": category,
+                "keyword": keyword,
+                "hits": stats["keywords"].get(category, {}).get(keyword, 0),
+            })
+
+    return {
+        "rows": stats["rows"],
+        "conflicts": stats["conflicts"],
+        "categories": [
+            {"category": category, "hits": stats["categories"].get(category, 0),
+             "assigned": stats["assigned"].get(category, 0)}
+            for category in categories
+        ],
+        "uncategorized": stats["assigned"].get("Uncategorized", 0),
+        "keywords": sorted(keyword_hits, key=lambda item: -item["hits"]),
+        "zero_hit_keywords": [item for item in keyword_hits if item["hits"] == 0],
+        "overlapping_keywords": {
+            keyword: names for keyword, names in keyword_categories.items() if len(set(names)) > 1
+        },
+        "short_keywords": [
+            {"category": category, "keyword": keyword}
+            for category, keywords in categories.items() for keyword in keywords
+            if len(keyword.strip()) <= short_keyword_length
+        ],
+        "conflict_pairs": sorted(
+            ({"categories": [first, second], "rows": rows}
+             for first, seconds in stats["pairs"].items() for second, rows in seconds.items()),
+            key=lambda item: -item["rows"],
+        ),
+    }
+
+def save_rule_report(report, output_folder):
+    """Write the rule report to rule_report.json in the output folder and return its path."""
+    os.makedirs(output_folder, exist_ok=True)
+    report_file = os.path.join(output_folder, "rule_report.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return report_file
+
+def format_rule_report(report, top=rule_report_top):
+    """Return a short text summary of a rule report."""
+    lines = [
+        f"Rules: {report['rows']} rows, {report['uncategorized']} uncategorized, "
+        f"{report['conflicts']} matched by several categories",
+        f"{len(report['zero_hit_keywords'])} of {len(report['keywords'])} keywords matched no row",
+    ]
+    if report["overlapping_keywords"]:
+        lines.append("In several categories: " + ", ".join(
+            f"'{keyword}'" for keyword in report["overlapping_keywords"]))
+    if report["short_keywords"]:
+        lines.append("Short keywords: " + ", ".join(
+            f"'{item['keyword']}' ({item['category']})" for item in report["short_keywords"]))
+    for item in report["conflict_pairs"][:top]:
+        lines.append(f"{item['categories'][0]} / {item['categories'][1]}: {item['rows']} rows")
+    return "\n".join(lines)
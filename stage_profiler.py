@@ -0,0 +1,209 @@
+import os
+import sys
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, the memory of a stage is then only known when profiling
+    resource = None
+
+# Number of functions and allocation sites kept in the report of a profiled run
+profile_top_entries = 30
+
+def peak_rss_mb():
+    """Return the peak resident memory of this process in MB, or None if it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def start_run_report(profile=False):
+    """
+    Start the report of a pipeline run.
+
+    With profile set, cProfile and tracemalloc run until finish_run_report is
+    called. They slow the run down noticeably, so they are off by default.
+    """
+    run_report = {
+        "started": datetime.now().isoformat(timespec="seconds"),
+        "profile": bool(profile),
+        "files": {},
+        "run": {"stages": {}},
+        "stages": {},
+        "start_wall": time.perf_counter(),
+        "start_cpu": time.process_time(),
+    }
+    if profile:
+        tracemalloc.start()
+        run_report["profiler"] = cProfile.Profile()
+        run_report["profiler"].enable()
+    return run_report
+
+def stage_record(run_report, stage, filename=None):
+    """
+    Return the record of a stage for a file, creating it when it is first measured.
+
+    Stages that are not about a single file are recorded for the whole run.
+    """
+    if filename:
+        file_entry = run_report["files"].setdefault(filename, {"stages": {}})
+    else:
+        file_entry = run_report["run"]
+    return file_entry["stages"].setdefault(stage, {
+        "calls": 0,
+        "rows": 0,
+        "wall_seconds": 0.0,
+        "cpu_seconds": 0.0,
+        "peak_memory_mb": None,
+        "peak_growth_mb": None,
+    })
+
+def add_peak_memory(record, peak):
+    """Keep the largest peak memory seen for a record."""
+    if peak is not None and (record["peak_memory_mb"] is None or peak > record["peak_memory_mb"]):
+        record["peak_memory_mb"] = peak
+
+def add_peak_growth(record, growth):
+    """Add to how much a record raised the peak resident memory of its process."""
+    if growth is not None:
+        record["peak_growth_mb"] = round((record["peak_growth_mb"] or 0.0) + growth, 1)
+
+@contextmanager
+def measure_stage(run_report, stage, filename=None, rows=0):
+    """
+    Add the wall time, CPU time and memory of the block to a stage of the run report.
+
+    A stage that runs once per chunk adds up over the chunks. The block can add
+    to the row count through the yielded record. When profiling, peak_memory_mb
+    is the traced peak of the block itself. peak_growth_mb is how much the block
+    raised the peak resident memory of the process. A stage that stays below
+    the peak of earlier stages or runs, e.g. in the long-lived GUI process,
+    shows 0. Nothing is measured when run_report is None.
+    """
+    if run_report is None:
+        yield {"rows": rows}
+        return
+
+    record = stage_record(run_report, stage, filename)
+    record["rows"] += rows
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+    start_peak = peak_rss_mb()
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield record
+    finally:
+        record["calls"] += 1
+        record["wall_seconds"] += time.perf_counter() - start_wall
+        record["cpu_seconds"] += time.process_time() - start_cpu
+        if tracing:
+            add_peak_memory(record, round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1))
+        if start_peak is not None:
+            add_peak_growth(record, peak_rss_mb() - start_peak)
+
+def merge_file_measurements(run_report, filename, stages):
+    """Add the stage records measured for a file in another process, e.g. a parse worker."""
+    for stage, measured in stages.items():
+        record = stage_record(run_report, stage, filename)
+        for key in ("calls", "rows", "wall_seconds", "cpu_seconds"):
+            record[key] += measured[key]
+        add_peak_memory(record, measured["peak_memory_mb"])
+        add_peak_growth(record, measured["peak_growth_mb"])
+
+def mark_file_cached(run_report, filename):
+    """Record that a file was unchanged and its cached result was used."""
+    run_report["files"].setdefault(filename, {"stages": {}})["cached"] = True
+
+def finish_run_report(run_report, status):
+    """
+    Stop the profilers and add the totals per stage and for the whole run.
+
+    status is "completed", "cancelled" or "failed".
+    """
+    profiler = run_report.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        run_report["profile_stats"] = pstats.Stats(profiler)
+        snapshot = tracemalloc.take_snapshot()
+        run_report["memory_top"] = [
+            {"location": str(statistic.traceback), "size_mb": round(statistic.size / (1024 * 1024), 3),
+             "blocks": statistic.count}
+            for statistic in snapshot.statistics("lineno")[:profile_top_entries]
+        ]
+        run_report["traced_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+        tracemalloc.stop()
+
+    run_report["status"] = status
+    run_report["finished"] = datetime.now().isoformat(timespec="seconds")
+    run_report["wall_seconds"] = round(time.perf_counter() - run_report.pop("start_wall"), 6)
+    run_report["cpu_seconds"] = round(time.process_time() - run_report.pop("start_cpu"), 6)
+    # The high-water mark of the whole process, which may have run earlier pipelines
+    run_report["process_peak_mb"] = peak_rss_mb()
+
+    # Totals per stage over all files, the per-file records are rounded for the report
+    stages = {}
+    for file_entry in list(run_report["files"].values()) + [run_report["run"]]:
+        for stage, record in file_entry["stages"].items():
+            record["wall_seconds"] = round(record["wall_seconds"], 6)
+            record["cpu_seconds"] = round(record["cpu_seconds"], 6)
+            total = stages.setdefault(stage, {"calls": 0, "rows": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                              "peak_memory_mb": None, "peak_growth_mb": None})
+            for key in ("calls", "rows", "wall_seconds", "cpu_seconds"):
+                total[key] += record[key]
+            add_peak_memory(total, record["peak_memory_mb"])
+            add_peak_growth(total, record["peak_growth_mb"])
+    for total in stages.values():
+        total["wall_seconds"] = round(total["wall_seconds"], 6)
+        total["cpu_seconds"] = round(total["cpu_seconds"], 6)
+        total["rows_per_second"] = round(total["rows"] / total["wall_seconds"]) if total["wall_seconds"] else None
+    run_report["stages"] = dict(sorted(stages.items(), key=lambda item: -item[1]["wall_seconds"]))
+    return run_report
+
+def save_run_report(run_report, output_folder):
+    """
+    Write the run report to run_report.json in the output folder.
+
+    A profiled run also writes run_profile.prof, which can be opened with
+    pstats or snakeviz, and the slowest functions are listed in the report.
+    Returns the path of the report.
+    """
+    os.makedirs(output_folder, exist_ok=True)
+    stored = dict(run_report)
+    profile_stats = stored.pop("profile_stats", None)
+    if profile_stats is not None:
+        profile_file = os.path.join(output_folder, "run_profile.prof")
+        profile_stats.dump_stats(profile_file)
+        stored["profile_file"] = profile_file
+        stored["profile_top"] = [
+            {"function": f"{filename}:{line}({name})", "calls": calls, "own_seconds": round(own_time, 6),
+             "cumulative_seconds": round(cumulative_time, 6)}
+            for (filename, line, name), (_, calls, own_time, cumulative_time, _) in sorted(
+                profile_stats.stats.items(), key=lambda item: -item[1][3])[:profile_top_entries]
+        ]
+
+    report_file = os.path.join(output_folder, "run_report.json")
+    with open(report_file, "w", encoding="utf-8") as f:
+        json.dump(stored, f, ensure_ascii=False, indent=2)
+    return report_file
+
+def format_run_report(run_report, top=6):
+    """Return a short text summary of a finished run report, slowest stages first."""
+    lines = [f"Run {run_report['status']} in {run_report['wall_seconds']:.2f} s "
+             f"(CPU {run_report['cpu_seconds']:.2f} s)"]
+    if run_report.get("process_peak_mb") is not None:
+        lines[0] += f", process peak memory {run_report['process_peak_mb']:.0f} MB"
+
+    cached = sum(1 for file_entry in run_report["files"].values() if file_entry.get("cached"))
+    lines.append(f"{len(run_report['files'])} file(s), {cached} from cache")
+    for stage, total in list(run_report["stages"].items())[:top]:
+        lines.append(f"{stage:<20} {total['wall_seconds']:8.2f} s {total['rows']:>10} rows")
+    return "\n".join(lines)
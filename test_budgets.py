@@ -0,0 +1,15 @@
+import pytest
+from budgets import parse_month, parse_amount
+
+def test_parse_month():
+    assert parse_month(" 2024-3 ") == "2024-03"
+    for value in ("", "   ", "nan", "NaT"):
+        with pytest.raises(ValueError):
+            parse_month(value)
+
+def test_parse_amount():
+    assert parse_amount("1 500,50") == 150050
+    assert parse_amount(" ") is None
+    for value in ("inf", "-inf", "nan", "1e30", "12kr"):
+        with pytest.raises(ValueError):
+            parse_amount(value)
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+from CleanDataKontoutskrift import categorize_entries, column_forklaring
+from category_rules import make_rules, match_keywords
+from categories import categories as default_categories
+
+def categorize(descriptions, categories, options=None):
+    """Return the category of every description."""
+    df = pd.DataFrame({column_forklaring: pd.Series(descriptions, dtype=object)})
+    rules = make_rules(categories, options)
+    return list(categorize_entries(df, column_forklaring, categories, rules=rules)["Category"].astype(str))
+
+def test_last_defined_category_wins():
+    categories = {"Mat": ["restaurant", "kiwi"], "Dining": ["restaurant"]}
+    assert categorize(["Restaurant Oslo", "KIWI 505"], categories) == ["Dining", "Mat"]
+    assert categorize(["Restaurant Oslo"], {"Dining": ["restaurant"], "Mat": ["restaurant"]}) == ["Mat"]
+
+def test_priority_breaks_ties_before_order():
+    categories = {"Mat": ["restaurant"], "Dining": ["restaurant"], "Uteliv": ["restaurant"]}
+    assert categorize(["Restaurant Oslo"], categories, {"Mat": {"priority": 1}}) == ["Mat"]
+    # Between equal priorities the category defined last still wins
+    assert categorize(["Restaurant Oslo"], categories, {"Mat": {"priority": 1}, "Dining": {"priority": 1}}) == ["Dining"]
+    assert categorize(["Restaurant Oslo"], categories, {"Uteliv": {"priority": -1}}) == ["Dining"]
+
+def test_empty_keyword_matches_text_with_a_word_character():
+    categories = {"Alt": [""], "Bil": ["shell"]}
+    assert categorize(["x", "Kiwi", "42", "SHELL Oslo"], categories) == ["Alt", "Alt", "Alt", "Bil"]
+
+def test_empty_keyword_skips_blank_and_punctuation_only_text():
+    categories = {"Alt": [""]}
+    assert categorize(["", "   ", "***", "- / ."], categories) == ["Uncategorized"] * 4
+
+def test_keywords_match_whole_words_only():
+    categories = {"Reise": ["Vy"], "Studielån": ["lan"]}
+    assert categorize(["VY Oslo", "Vyborg", "Plan B", "LAN party"], categories) == [
+        "Reise", "Uncategorized", "Uncategorized", "Studielån"]
+
+def test_phrase_and_punctuated_keywords():
+    descriptions = ["BATTLE NET *1234", "Battle.net 12.03", "battle", "DISNEY+ 12.03.24", "Circle K Oslo", "Circle Kafe"]
+    assert categorize(descriptions, default_categories) == [
+        "Hobby: Gaming", "Hobby: Gaming", "Mat og spiselige ting", "Streaming", "Bil", "Mat og spiselige ting"]
+
+def test_punctuated_keywords_keep_the_word_boundaries_of_the_old_regex():
+    matcher = make_rules({"Streaming": ["disney+", "battle.net"], "Bil": ["Circle K"]})["matcher"]
+    assert match_keywords(matcher, "circle k 505") == [["Bil", "Circle K"]]
+    assert match_keywords(matcher, "battle.net eu") == [["Streaming", "battle.net"]]
+    assert match_keywords(matcher, "battlexnet") == []
+    # Like r"\bdisney\+\b", a keyword ending in punctuation needs a word character after it
+    assert match_keywords(matcher, "disney+nordic") == [["Streaming", "disney+"]]
+    assert match_keywords(matcher, "disney+ nordic") == []
+    assert match_keywords(matcher, "disney nordic") == []
+
+def test_missing_descriptions_are_uncategorized():
+    categories = {"Alt": [""], "Mat": ["kiwi"]}
+    assert categorize([None, np.nan, "Kiwi"], categories) == ["Uncategorized", "Uncategorized", "Mat"]
+    assert match_keywords(make_rules(categories)["matcher"], None) == []
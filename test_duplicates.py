@@ -0,0 +1,31 @@
+import pandas as pd
+from columnar_store import apply_schema
+from duplicates import row_fingerprints, find_duplicates
+
+def statement(accounts, descriptions):
+    """Return a cleaned statement chunk with one purchase of 100 kroner per row, all on the same day."""
+    return apply_schema(pd.DataFrame({
+        "Kontonummer": accounts,
+        "Dato": ["01.03.2024"] * len(accounts),
+        "Forklaring": pd.Series(descriptions, dtype=object),
+        "Rentedato": ["01.03.2024"] * len(accounts),
+        "Ut fra konto": [100.0] * len(accounts),
+        "Inn på konto": [None] * len(accounts),
+    }))
+
+def test_same_purchase_on_two_accounts_is_not_a_duplicate():
+    fingerprints = row_fingerprints(statement(["1234.56.78901", "1234.56.78902"], ["Kiwi 505"] * 2), {})
+    assert fingerprints.iloc[0] != fingerprints.iloc[1]
+
+    # The export of the second account does not drop the purchase already read from the first
+    seen = set()
+    find_duplicates(row_fingerprints(statement(["1234.56.78901"], ["Kiwi 505"]), {}), seen)
+    assert not find_duplicates(row_fingerprints(statement(["1234.56.78902"], ["Kiwi 505"]), {}), seen).any()
+
+def test_overlapping_export_of_the_same_account_is_a_duplicate():
+    seen = set()
+    first = statement(["1234.56.78901"] * 2, ["Kiwi 505"] * 2)
+    assert not find_duplicates(row_fingerprints(first, {}), seen).any()
+    # Two identical purchases on one day are both kept, a third one in the later export is new
+    later = statement(["1234.56.78901"] * 3, ["KIWI  505"] * 3)
+    assert list(find_duplicates(row_fingerprints(later, {}), seen)) == [True, True, False]
@@ -0,0 +1,64 @@
+import pandas as pd
+from columnar_store import apply_schema
+from ledger import (
+    open_ledger, new_batch, upsert_transactions, finish_statement, recategorize_merchants, query_account_totals,
+)
+
+def statement(descriptions, categories):
+    """Return a categorized frame in the in-memory schema."""
+    return apply_schema(pd.DataFrame({
+        "Dato": ["01.03.2024"] * len(descriptions),
+        "Forklaring": pd.Series(descriptions, dtype=object),
+        "Rentedato": ["01.03.2024"] * len(descriptions),
+        "Ut fra konto": [100.0] * len(descriptions),
+        "Inn på konto": [None] * len(descriptions),
+        "Category": categories,
+    }))
+
+def load(connection, df):
+    batch = new_batch()
+    upsert_transactions(connection, "a.xlsx", df, 0, batch)
+    finish_statement(connection, "a.xlsx", batch)
+
+def rows(connection):
+    return connection.execute("SELECT forklaring, category, manual FROM transactions ORDER BY row_number").fetchall()
+
+def test_reload_keeps_categories_set_by_hand(tmp_path):
+    connection = open_ledger(str(tmp_path / "ledger.sqlite"))
+    load(connection, statement(["Kiwi 505", "Rema 1000"], ["Uncategorized", "Mat"]))
+    recategorize_merchants(connection, {"kiwi 505": "Mat"})
+    load(connection, statement(["Kiwi 505", "Rema 1000"], ["Uncategorized", "Mat"]))
+    assert rows(connection) == [("Kiwi 505", "Mat", 1), ("Rema 1000", "Mat", 0)]
+    connection.close()
+
+def test_reload_with_blank_description_drops_the_hand_set_category(tmp_path):
+    connection = open_ledger(str(tmp_path / "ledger.sqlite"))
+    load(connection, statement(["Kiwi 505", "Rema 1000"], ["Uncategorized", "Mat"]))
+    recategorize_merchants(connection, {"kiwi 505": "Mat"})
+    load(connection, statement([None, "Rema 1000"], ["Uncategorized", "Mat"]))
+    assert rows(connection) == [(None, "Uncategorized", 0), ("Rema 1000", "Mat", 0)]
+    connection.close()
+
+def test_account_minimum_and_maximum_skip_missing_amounts(tmp_path):
+    connection = open_ledger(str(tmp_path / "ledger.sqlite"))
+    load(connection, statement(["Kiwi 505", "Rema 1000"], ["Mat", "Mat"]))
+    totals = query_account_totals(connection).iloc[0]
+    assert (totals["Ut fra konto min"], totals["Ut fra konto max"]) == (100.0, 100.0)
+    assert pd.isna(totals["Inn på konto min"]) and pd.isna(totals["Inn på konto max"])
+    connection.close()
+
+def test_partials_of_an_old_ledger_are_built_again(tmp_path):
+    ledger_file = str(tmp_path / "ledger.sqlite")
+    connection = open_ledger(ledger_file)
+    load(connection, statement(["Kiwi 505"], ["Mat"]))
+    # The schema before the minimum and maximum could be NULL, with the old 0 minimum
+    connection.executescript(
+        "DROP TABLE partials; CREATE TABLE partials (source_file TEXT NOT NULL, month TEXT, category TEXT NOT NULL, "
+        "ut_sum INTEGER NOT NULL, inn_sum INTEGER NOT NULL, count INTEGER NOT NULL, ut_min INTEGER NOT NULL, "
+        "ut_max INTEGER NOT NULL, inn_min INTEGER NOT NULL, inn_max INTEGER NOT NULL); "
+        "INSERT INTO partials VALUES ('a.xlsx', '2024-03', 'Mat', 10000, 0, 1, 10000, 10000, 0, 0);"
+    )
+    connection.close()
+    connection = open_ledger(ledger_file)
+    assert connection.execute("SELECT ut_min, inn_min, inn_max FROM partials").fetchall() == [(10000, None, None)]
+    connection.close()
@@ -0,0 +1,52 @@
+import random
+from difflib import SequenceMatcher
+from CleanDataKontoutskrift import group_similar_names
+
+def brute_force_groups(names, similarity_threshold):
+    """Return the first name of the group of every name, comparing every pair."""
+    parent = list(range(len(names)))
+
+    def find(i):
+        while parent[i] != i:
+            i = parent[i]
+        return i
+
+    for i in range(len(names)):
+        for j in range(i + 1, len(names)):
+            if SequenceMatcher(None, names[i], names[j]).ratio() >= similarity_threshold:
+                root1, root2 = find(i), find(j)
+                parent[max(root1, root2)] = min(root1, root2)
+    return {name: names[find(i)] for i, name in enumerate(names)}
+
+def variants(count, seed):
+    """Return distinct merchant-like names, with a few edited variants of each base name."""
+    generator = random.Random(seed)
+    bases = ["kiwi 505 sandvika", "rema 1000 majorstuen", "circle k bryn", "vipps *ola nordmann",
+             "netflix.com", "xxl sport", "spar", "coop extra", "a", "ab", "b"]
+    names = list(bases)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 *."
+    while len(names) < count:
+        name = list(generator.choice(names))
+        for _ in range(generator.randint(1, 3)):
+            position = generator.randrange(len(name) + 1)
+            edit = generator.choice(("insert", "delete", "replace"))
+            if edit == "insert" or not name:
+                name.insert(position, generator.choice(alphabet))
+            elif edit == "delete":
+                del name[min(position, len(name) - 1)]
+            else:
+                name[min(position, len(name) - 1)] = generator.choice(alphabet)
+        names.append("".join(name))
+    return list(dict.fromkeys(names))
+
+def test_groups_match_brute_force():
+    for seed in range(3):
+        names = variants(150, seed)
+        mapping, stats = group_similar_names(names, 0.8)
+        assert mapping == brute_force_groups(names, 0.8)
+        assert stats["compared"] + stats["pruned"] == len(names) * (len(names) - 1) // 2
+
+def test_groups_match_brute_force_at_other_thresholds():
+    names = variants(100, 7)
+    for threshold in (0.6, 0.9):
+        assert group_similar_names(names, threshold)[0] == brute_force_groups(names, threshold)